@@ -107,7 +107,15 @@ def make_app(
     ) -> fastapi.responses.HTMLResponse:
         return templates.TemplateResponse(request, name)
 
-    del swagger_ui_html
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> fastapi.responses.PlainTextResponse:
+        ctx = _core.context.get()
+        return fastapi.responses.PlainTextResponse(
+            ctx["metrics"].render(ctx["httpx_client"]),
+            media_type="text/plain; version=0.0.4",
+        )
+
+    del swagger_ui_html, metrics
     return app
 
 
@@ -117,3 +125,4 @@ class _JSONResponse(fastapi.responses.JSONResponse):
 
 async def _context(request: fastapi.Request) -> None:  # ruff: ignore[unused-async]
     _core.context.set(cast("_core.Context", request.scope["state"]))
+    _core.request.set(request)
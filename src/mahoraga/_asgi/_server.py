@@ -15,11 +15,14 @@
 __all__ = ["Config", "run"]
 
 import asyncio
+import contextlib
 import functools
 import inspect
 import io
 import logging
+import multiprocessing
 import pathlib
+import socket
 import sys
 from typing import TYPE_CHECKING, Protocol, cast, override
 
@@ -34,7 +37,7 @@ from mahoraga import _conda, _core, _preload
 from . import _app
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Generator
     from logging.config import (
         _DictConfigArgs,  # pyright: ignore[reportPrivateUsage]
     )
@@ -51,7 +54,7 @@ except ImportError:
     granian = None
 
 
-def run() -> None:
+def run(worker: int = 0) -> None:
     cfg = Config()
     log_level = cfg.log.levelno()
     log_config: _DictConfigArgs = {
@@ -134,18 +137,25 @@ def run() -> None:
         },
         "disable_existing_loggers": False,
     }
+    if worker:
+        # Rotating one file from several processes would lose records
+        log_config["handlers"]["filesystem"]["filename"] = (
+            f"log/mahoraga.{worker}.log"
+        )
     if cfg.server.is_uvicorn() or not cfg.log.access:
         del log_config["loggers"]["granian.access"]
     if cfg.server.is_granian() or not cfg.log.access:
         del log_config["loggers"]["uvicorn.access"]
     if cfg.server.is_granian() or log_level > logging.INFO:
         del log_config["loggers"]["uvicorn.error"]
-    cfg.run(cast("dict[str, object]", log_config))
+    cfg.run(cast("dict[str, object]", log_config), worker)
 
 
 class Config(_core.Config, toml_file="mahoraga.toml"):
-    def run(self, log_config: dict[str, object]) -> None:
+    def run(self, log_config: dict[str, object], worker: int = 0) -> None:
+        self._worker = worker
         started = False
+        workers = self.server.workers
         static_files = fastapi.staticfiles.StaticFiles(
             packages=[("mahoraga", "_static")],
         )
@@ -173,6 +183,10 @@ class Config(_core.Config, toml_file="mahoraga.toml"):
                 factory=True,
             )
             server = UvicornServer(cfg)
+            serve = functools.partial(
+                server.serve,
+                [_reuseport(self)] if workers > 1 else None,
+            )
         elif not granian:
             message = (
                 "server.implementation == 'granian' in mahoraga.toml, "
@@ -202,7 +216,11 @@ class Config(_core.Config, toml_file="mahoraga.toml"):
                 address=str(self.server.host),
                 port=self.server.port,
                 interface=granian.constants.Interfaces.ASGI,
-                runtime_threads=dask.system.CPU_COUNT or 1,
+                # Every process binds its own socket with SO_REUSEPORT
+                runtime_threads=max(
+                    (dask.system.CPU_COUNT or 1) // workers,
+                    1,
+                ),
                 http=granian.constants.HTTPModes.http1,
                 backlog=self.server.backlog,
                 backpressure=self.server.limit_concurrency,
@@ -222,13 +240,15 @@ class Config(_core.Config, toml_file="mahoraga.toml"):
             )
             server.workers_kill_timeout = self.server.workers_kill_timeout()
             logging.getLogger("_granian.serve").addFilter(Filter())
+            serve = server.serve
         _preload.configure_logging_extra(self.log.levelno())
         try:
-            asyncio.run(
-                server.serve(),
-                debug=self.log.level == "debug",
-                loop_factory=self.loop_factory,
-            )
+            with _children(0 if worker else workers - 1, self):
+                asyncio.run(
+                    serve(),
+                    debug=self.log.level == "debug",
+                    loop_factory=self.loop_factory,
+                )
         except KeyboardInterrupt:
             pass
         except SystemExit:
@@ -244,6 +264,26 @@ class _Lifespan(Protocol):
     state: _core.Context
 
 
+@contextlib.contextmanager
+def _children(n: int, cfg: Config) -> Generator[None]:
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(target=run, args=(i,), daemon=True)
+        for i in range(1, n + 1)
+    ]
+    for child in children:
+        child.start()
+    try:
+        yield
+    finally:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join(cfg.server.workers_kill_timeout())
+            if child.is_alive():
+                child.kill()
+
+
 def _granian_lifespan() -> None:
     for info in inspect.stack(0):
         if lifespan := info.frame.f_locals.get("lifespan_handler"):
@@ -252,6 +292,20 @@ def _granian_lifespan() -> None:
     _core.unreachable()
 
 
+def _reuseport(cfg: Config) -> socket.socket:
+    [(family, type_, proto, _, address), *_] = socket.getaddrinfo(
+        str(cfg.server.host),
+        cfg.server.port,
+        type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE,
+    )
+    sock = socket.socket(family, type_, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    return sock
+
+
 def _root_handlers() -> list[str]:
     handlers = ["filesystem"]
     if isinstance(sys.stdout, io.TextIOBase) and sys.stdout.isatty():
@@ -265,14 +319,19 @@ def _root_handlers() -> list[str]:
 def _split_repo(lifespan: _Lifespan) -> None:
     state = lifespan.state
     cfg = state["config"]
-    if any(channel.platforms for channel in cfg.shard.values()):
+    dask_client = state["dask_client"]
+    # Only the first worker process runs a Dask cluster
+    if dask_client and any(
+        channel.platforms for channel in cfg.shard.values()
+    ):
         loop = asyncio.get_running_loop()
         loop.call_soon(
             _conda.split_repo,
             loop,
             cfg,
-            state["dask_client"],
+            dask_client,
             state["futures"],
+            state["metrics"],
         )
 
 
@@ -15,7 +15,9 @@
 __all__ = ["main"]
 
 import argparse
+import asyncio
 import contextlib
+import ipaddress
 import pathlib
 import sys
 import urllib.parse
@@ -28,6 +30,8 @@ import pydantic_settings
 
 from mahoraga import __version__, _asgi, _core
 
+from . import _warm
+
 
 def main() -> None:
     """CLI entry."""
@@ -116,6 +120,49 @@ class _Run(pydantic.BaseModel, validate_default=True):
         _asgi.run(self.root)
 
 
+class _Warm(pydantic.BaseModel, validate_default=True):
+    """Prefetch the artifacts pinned by lockfiles into the cache.
+
+    Supported lockfiles are `pixi.lock`, `uv.lock`, `conda-lock.yml`,
+    `pylock.toml` and `pyodide-lock.json`. The artifacts are requested
+    from a running Mahoraga server, which verifies and caches them just
+    like it does for any other client, so start the server first.
+    """
+
+    lockfiles: Annotated[
+        pydantic_settings.CliPositionalArg[list[pydantic.FilePath]],
+        pydantic.Field(description="Lockfiles to read"),
+    ]
+    root: Annotated[
+        pydantic.DirectoryPath,
+        pydantic.Field(description="Root path of a directory containing "
+                                   "mahoraga.toml"),
+        _core.predicate("(input_value / 'mahoraga.toml').is_file()"),
+    ] = pathlib.Path()
+    jobs: Annotated[
+        pydantic.PositiveInt,
+        pydantic.Field(description="Maximum number of parallel downloads"),
+    ] = 8
+
+    def cli_cmd(self) -> None:
+        with contextlib.chdir(self.root):
+            cfg = _asgi.Config()
+        host = cfg.server.host
+        if host.is_unspecified:
+            host = ipaddress.IPv4Address("127.0.0.1")
+        targets = dict.fromkeys(
+            path
+            for lockfile in self.lockfiles
+            for path in _warm.paths(lockfile)
+        )
+        if failures := asyncio.run(
+            _warm.warm(f"http://{host}:{cfg.server.port}", targets, self.jobs),
+        ):
+            click.echo(f"{failures} of {len(targets)} artifacts failed")
+            sys.exit(1)
+        click.echo(f"Done. {len(targets)} artifacts are cached.")
+
+
 class _Version(pydantic.BaseModel):
     """Show Mahoraga version and exit."""
 
@@ -186,6 +233,10 @@ class _Main(
         pydantic_settings.CliSubCommand[_Run],
         pydantic.Field(description=_summary(_Run.__doc__)),
     ]
+    warm: Annotated[
+        pydantic_settings.CliSubCommand[_Warm],
+        pydantic.Field(description=_summary(_Warm.__doc__)),
+    ]
     version: Annotated[
         pydantic_settings.CliSubCommand[_Version],
         pydantic.Field(description=_summary(_Version.__doc__)),
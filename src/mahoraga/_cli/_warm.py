@@ -0,0 +1,115 @@
+# Copyright 2025-2026 hingebase
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+__all__ = ["paths", "warm"]
+
+import asyncio
+import contextlib
+import json
+import re
+import urllib.parse
+from typing import TYPE_CHECKING, Any
+
+import httpx
+import rich.filesize
+import rich.progress
+
+if TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Collection, Iterator, Mapping
+
+
+def paths(lockfile: pathlib.Path) -> Iterator[str]:
+    text = lockfile.read_text(encoding="utf-8")
+    if lockfile.suffix == ".json":
+        yield from _pyodide(json.loads(text))
+        return
+    # pixi.lock, conda-lock.yml, uv.lock and pylock.toml all pin their
+    # artifacts by URL, which is all we need
+    for match in _url.finditer(text):
+        if path := _path(match[0]):
+            yield path
+
+
+async def warm(base_url: str, targets: Collection[str], jobs: int) -> int:
+    todo = iter(targets)
+    failures = 0
+    nbytes = 0
+    async with contextlib.AsyncExitStack() as stack:
+        progress = stack.enter_context(rich.progress.Progress(
+            rich.progress.SpinnerColumn(),
+            rich.progress.TextColumn("{task.description}"),
+            rich.progress.BarColumn(),
+            rich.progress.MofNCompleteColumn(),
+            rich.progress.TextColumn("{task.fields[transferred]}"),
+            rich.progress.TimeElapsedColumn(),
+        ))
+        client = await stack.enter_async_context(httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(15, read=300),
+            trust_env=False,
+        ))
+        task = progress.add_task(
+            "Warming",
+            total=len(targets),
+            transferred=rich.filesize.decimal(0),
+        )
+
+        async def worker() -> None:
+            nonlocal failures, nbytes
+            for path in todo:
+                try:
+                    async with client.stream("GET", path) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_raw():
+                            nbytes += len(chunk)
+                            progress.update(
+                                task,
+                                transferred=rich.filesize.decimal(nbytes),
+                            )
+                except httpx.HTTPError as e:
+                    failures += 1
+                    progress.console.print(f"Failed to fetch {path}: {e}")
+                progress.advance(task)
+
+        await asyncio.gather(*(worker() for _ in range(jobs)))
+    return failures
+
+
+def _path(url: str) -> str | None:
+    path = urllib.parse.urlsplit(url).path
+    if match := _pypi.search(path):
+        return f"/pypi/packages/{match[1]}"
+    if match := _conda.search(path):
+        channel, label, platform, name = match.groups("")
+        return f"/conda/{channel}{label}/{platform}/{name}"
+    return None
+
+
+def _pyodide(lock: Mapping[str, Any]) -> Iterator[str]:
+    version = lock["info"]["version"]
+    for package in lock["packages"].values():
+        file_name = package["file_name"]
+        if "://" in file_name:
+            if path := _path(file_name):
+                yield path
+        else:
+            yield f"/pyodide/v{version}/full/{file_name}"
+
+
+_conda = re.compile(
+    r"/([^/]+)(/label/[^/]+)?/([^/]+)/([^/]+\.(?:conda|tar\.bz2))$",
+)
+_pypi = re.compile(r"/packages/([^/]+/[^/]+/[^/]+/[^/]+)$")
+_url = re.compile(r"https?://[^\s\"'<>]+")
@@ -20,7 +20,7 @@ import pathlib
 import posixpath
 from typing import Annotated
 
-import fastapi.responses
+import fastapi
 import rattler.platform  # ruff: ignore[typing-only-third-party-import]
 
 from mahoraga import _core
@@ -79,8 +79,8 @@ async def _proxy_cache(
     else:
         cache_location = pathlib.Path("channels", channel, platform, name)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(
                 cache_location,
                 media_type=media_type,
             )
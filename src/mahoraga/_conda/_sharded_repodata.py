@@ -18,10 +18,12 @@ import asyncio
 import compression.zstd
 import contextlib
 import contextvars
+import functools
 import hashlib
 import logging
 import pathlib
 import shutil
+import time
 from typing import TYPE_CHECKING, Any
 
 import anyio
@@ -36,6 +38,8 @@ from mahoraga import _core
 from . import _models, _utils
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from distributed import Client, Future
 
 router: fastapi.APIRouter = fastapi.APIRouter(route_class=_core.APIRoute)
@@ -121,8 +125,9 @@ def split_repo(
     cfg: _core.Config,
     client: Client,
     futures: set[asyncio.Future[Any] | Future[Any]],
+    metrics: _core.Metrics,
 ) -> None:
-    loop.call_later(3600., split_repo, loop, cfg, client, futures)
+    loop.call_later(3600., split_repo, loop, cfg, client, futures, metrics)
     for channel, channel_config in cfg.shard.items():
         channel_relations: _models.ChannelRelations = {}
         if base := channel_config.base:
@@ -134,12 +139,30 @@ def split_repo(
                 _worker, cfg, channel, platform, channel_relations)
             futures.add(fut)
             fut.add_done_callback(futures.discard)  # pyright: ignore[reportUnknownMemberType]
+            fut.add_done_callback(  # pyright: ignore[reportUnknownMemberType]
+                functools.partial(
+                    _observe,
+                    loop,
+                    metrics.shards[channel, platform].observe,
+                    time.monotonic(),
+                ),
+            )
 
 
 def _cache_location(*segments: str) -> anyio.Path:
     return anyio.Path("channels", *segments, "repodata_shards.msgpack.zst")
 
 
+def _observe(
+    loop: asyncio.AbstractEventLoop,
+    observe: Callable[[float], object],
+    tic: float,
+    _: object,
+) -> None:
+    # Dask may run the callback in another thread
+    loop.call_soon_threadsafe(observe, time.monotonic() - tic)
+
+
 def _packages(
     package_name: rattler.PackageName,
     package_format_selection: rattler.PackageFormatSelection,
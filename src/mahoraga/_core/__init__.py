@@ -16,15 +16,21 @@ __all__ = [
     "APIRoute",
     "Address",
     "AsyncClient",
+    "CacheIndex",
     "Config",
     "Context",
+    "Download",
+    "FileResponse",
     "GitHubRelease",
+    "HttpCache",
+    "Metrics",
     "NPMBase",
     "Response",
     "Server",
     "Statistics",
     "StreamingResponse",
     "WeakValueDictionary",
+    "blob_path",
     "cache_action",
     "cached_or_locked",
     "context",
@@ -34,27 +40,35 @@ __all__ = [
     "immutable",
     "load_balance",
     "predicate",
+    "request",
     "schedule_exit",
+    "simple_cache_key",
     "stream",
     "unreachable",
 ]
 
 import contextvars
-from typing import NoReturn
+from typing import TYPE_CHECKING, NoReturn
 
 from ._config import Address, Config, Server, predicate
 from ._context import (
     AsyncClient,
     Context,
+    Download,
     Statistics,
     WeakValueDictionary,
     cache_action,
     cached_or_locked,
     schedule_exit,
+    simple_cache_key,
 )
+from ._http_cache import HttpCache
+from ._index import CacheIndex, blob_path
 from ._metadata import GitHubRelease, NPMBase, headers
+from ._metrics import Metrics
 from ._stream import (
     APIRoute,
+    FileResponse,
     Response,
     StreamingResponse,
     get,
@@ -64,7 +78,14 @@ from ._stream import (
     stream,
 )
 
+if TYPE_CHECKING:
+    from fastapi import Request
+
 context: contextvars.ContextVar[Context] = contextvars.ContextVar("context")
+request: contextvars.ContextVar[Request | None] = contextvars.ContextVar(
+    "request",
+    default=None,
+)
 
 
 def unreachable(message: str = "Unreachable") -> NoReturn:
@@ -21,7 +21,10 @@ import ipaddress
 import itertools
 import os
 import pathlib
+import posixpath
+import socket
 import sys
+import urllib.parse
 from collections.abc import Iterable, Sequence
 from typing import (
     TYPE_CHECKING,
@@ -34,11 +37,9 @@ from typing import (
 )
 
 import annotated_types as at
-import anysqlite
 import dask.config
 import dask.system
 import distributed
-import hishel
 import httpx
 import pooch_rattler
 import pydantic
@@ -64,6 +65,8 @@ else:
     import uvloop  # pyright: ignore[reportMissingImports]
 
 _DASK_DASHBOARD = 8787
+_PROBE_PYODIDE = "v0.26.4"
+_PROBE_PYTHON = "3.12.10"
 
 
 def predicate(func: str) -> at.Predicate:
@@ -116,6 +119,11 @@ class Server(Address, **_model_config):
                                    "allow"),
         at.Ge(128),
     ] = 511
+    x_accel_redirect: Annotated[
+        bool,
+        pydantic.Field(description="Let the front server send cached files "
+                                   "via X-Accel-Redirect"),
+    ] = False
     keep_alive: Annotated[
         pydantic.PositiveInt,
         pydantic.Field(description="Time in seconds to wait before closing "
@@ -126,6 +134,24 @@ class Server(Address, **_model_config):
         pydantic.Field(description="Time in seconds to wait before graceful "
                                    "shutdown"),
     ] = 0
+    workers: Annotated[
+        pydantic.PositiveInt,
+        pydantic.Field(description="Number of server processes sharing the "
+                                   "port via SO_REUSEPORT"),
+    ] = 1
+
+    @pydantic.model_validator(mode="after")
+    def reuseport(self) -> Self:
+        if self.workers > 1 and not (
+            hasattr(socket, "SO_REUSEPORT")
+            and (self.is_uvicorn() or sys.platform == "linux")
+        ):
+            message = (
+                "server.workers > 1 requires SO_REUSEPORT, "
+                "which granian only uses on Linux"
+            )
+            raise ValueError(message)
+        return self
 
     def is_granian(self) -> bool:
         return self.implementation == "granian"
@@ -166,6 +192,22 @@ class _CORS(pydantic.BaseModel, **_model_config):
     max_age: pydantic.NonNegativeInt = 600
 
 
+class _Cache(pydantic.BaseModel, **_model_config):
+    max_size: pydantic.ByteSize = pydantic.ByteSize(0)
+    http_max_size: pydantic.ByteSize = pydantic.ByteSize(1 << 30)
+    quota: dict[
+        Literal[
+            "channels",
+            "npm",
+            "packages",
+            "pyodide",
+            "python-build-standalone",
+            "uv",
+        ],
+        pydantic.ByteSize,
+    ] = {}
+
+
 _adapter = pydantic.TypeAdapter(list[_HttpUrl])
 
 
@@ -248,8 +290,29 @@ class _Conda(pydantic.BaseModel, **_model_config):
         "emscripten-forge-4x": "https://prefix.dev/",
     })
 
-
-class _PyPI(pydantic.BaseModel):
+    def probes(self) -> Iterator[str]:
+        # Every channel has a noarch subdir, whatever else it serves
+        for url in self.default:
+            yield posixpath.join(str(url), "conda-forge", "noarch",
+                                 "repodata.json")
+        for channel, urls in itertools.chain(
+            self.with_label.items(),
+            self.without_label.items(),
+        ):
+            if not isinstance(urls, str):
+                for url in urls:
+                    yield posixpath.join(str(url), channel, "noarch",
+                                         "repodata.json")
+        for channel, url in self.channel_alias.items():
+            yield posixpath.join(str(url), channel, "noarch", "repodata.json")
+
+
+class _Pool(pydantic.BaseModel, **_model_config):
+    limit: pydantic.PositiveInt | None = None
+    keep_alive: pydantic.PositiveInt | None = None
+
+
+class _PyPI(pydantic.BaseModel, **_model_config):
     html: list[_HttpUrl] = _adapter.validate_python([
         "https://mirror.nju.edu.cn/pypi/web/",
         "https://mirror.sjtu.edu.cn/pypi/web/",
@@ -269,6 +332,9 @@ class _PyPI(pydantic.BaseModel):
         ])
     )
 
+    stale_while_revalidate: pydantic.NonNegativeInt = 86400
+    stale_if_error: pydantic.NonNegativeInt = 604800
+
     def all(self) -> Iterator[_HttpUrl]:
         return itertools.chain(self.html, self.json_)
 
@@ -344,6 +410,16 @@ class _Upstream(pydantic.BaseModel, **_model_config):
         "https://releases.astral.sh/github/python-build-standalone/releases/download/",
     ])
     uv: _Uv = _Uv()
+    segment_threshold: pydantic.NonNegativeInt = 64 << 20
+    hedge_budget: Annotated[float, at.Ge(0), at.Le(1)] = 0.
+    probe_interval: pydantic.NonNegativeInt = 3600
+    probe_budget: pydantic.NonNegativeInt = 16 << 20
+    limit_per_host: pydantic.NonNegativeInt = 64
+    not_found_ttl: pydantic.NonNegativeInt = 300
+    pool: dict[str, _Pool] = {
+        "api.github.com": _Pool(limit=8),
+        "files.pythonhosted.org": _Pool(limit=32),
+    }
     backup: dict[str, pydantic.NonNegativeInt] = {
         "anaconda.org": 0,
         "conda.anaconda.org": 0,
@@ -363,17 +439,107 @@ class _Upstream(pydantic.BaseModel, **_model_config):
             return dict.fromkeys(backup, 0)
         return backup
 
+    def probes(self) -> Iterator[str]:
+        # Objects which every mirror keeps. Mirrors of tagged GitHub
+        # releases drop old tags, so hosts only found there are skipped.
+        yield from self.conda.probes()
+        for url in self.pyodide:
+            yield posixpath.join(str(url), "pyodide", _PROBE_PYODIDE, "full",
+                                 "pyodide-lock.json")
+        for url in self.pypi.all():
+            yield posixpath.join(str(url), "simple", "pip", "")
+        for url in self.python:
+            yield urllib.parse.unquote(str(url)).format(
+                version=_PROBE_PYTHON,
+                name=f"python-{_PROBE_PYTHON}-embed-amd64.zip",
+            )
+        for url in self.uv.latest:
+            yield posixpath.join(
+                str(url),
+                "uv-x86_64-unknown-linux-gnu.tar.gz",
+            )
+
 
 class Config(pydantic_settings.BaseSettings, **_model_config):
     server: Server = Server()
     log: _Log = _Log()
     shard: dict[str, _Shard] = {}
     cors: _CORS = _CORS()
+    cache: _Cache = _Cache()
     upstream: _Upstream = _Upstream()
     eager_task_execution: bool = False
+    _worker: int = 0
 
     @contextlib.asynccontextmanager
     async def lifespan(self, _: FastAPI) -> AsyncGenerator[_core.Context]:
+        pypi = self.upstream.pypi
+        http_cache = _core.HttpCache(
+            self.cache.http_max_size,
+            # Stale copies must outlive the windows they are served in
+            max(pypi.stale_while_revalidate, pypi.stale_if_error),
+            shared=self.server.workers > 1,
+            # Only the first worker process evicts, as with cached files
+            evict=not self._worker,
+        )
+        statistics = _core.Statistics(
+            backup_servers=self.upstream.backup,
+            hedge_budget=self.upstream.hedge_budget,
+            shared=self.server.workers > 1,
+        )
+        async with self._dask() as dask_client, _core.AsyncClient(
+            headers={"User-Agent": f"mahoraga/{__version__}"},
+            timeout=httpx.Timeout(15, read=60),
+            follow_redirects=False,
+            limits=httpx.Limits(
+                max_connections=self.server.limit_concurrency,
+                keepalive_expiry=self.server.keep_alive,
+            ),
+            storage=http_cache,
+        ) as httpx_client, http_cache.maintain(), statistics.persist(), (
+            statistics.probe(
+                self.upstream.probes(),
+                interval=self.upstream.probe_interval,
+                # The others learn the scores from statistics.json
+                budget=0 if self._worker else self.upstream.probe_budget,
+            )
+        ), _core.Metrics(
+            worker=self._worker if self.server.workers > 1 else None,
+        ).monitor() as metrics:
+            ctx: _core.Context = {
+                "config": self,
+                "dask_client": dask_client,
+                "downloader": pooch_rattler.Downloader(),
+                "downloads": {},
+                "futures": set(),
+                "http_cache": http_cache,
+                "httpx_client": httpx_client,
+                # Only the first worker process evicts, the others
+                # merely remember what is cached
+                "index": _core.CacheIndex(
+                    self.cache.max_size,
+                    self.cache.quota,
+                    shared=self.server.workers > 1,
+                ) if not self._worker else _core.CacheIndex(),
+                "locks": _core.WeakValueDictionary(),
+                "metrics": metrics,
+                "statistics": statistics,
+            }
+            async with ctx["index"].maintain(ctx):
+                yield ctx
+
+    @no_type_check
+    def loop_factory(self) -> asyncio.AbstractEventLoop:
+        loop = uvloop.new_event_loop()
+        if self.eager_task_execution:
+            loop.set_task_factory(asyncio.eager_task_factory)
+        return loop
+
+    @contextlib.asynccontextmanager
+    async def _dask(self) -> AsyncGenerator[distributed.Client | None]:
+        if self._worker:
+            # One cluster per host, run by the first worker process
+            yield None
+            return
         # Discard all Dask environment variables which have been read
         # into the global config
         for name in [name for name in os.environ if name.startswith("DASK_")]:
@@ -432,37 +598,8 @@ class Config(pydantic_settings.BaseSettings, **_model_config):
         ) as cluster, distributed.Client(
             cluster,
             asynchronous=True,
-        ) as dask_client, _core.AsyncClient(
-            headers={"User-Agent": f"mahoraga/{__version__}"},
-            timeout=httpx.Timeout(15, read=60),
-            follow_redirects=False,
-            limits=httpx.Limits(
-                max_connections=self.server.limit_concurrency,
-                keepalive_expiry=self.server.keep_alive,
-            ),
-            storage=hishel.AsyncSqliteStorage(
-                connection=await anysqlite.connect(":memory:"),
-                default_ttl=600.,
-            ),
-        ) as httpx_client:
-            yield {
-                "config": self,
-                "dask_client": dask_client,
-                "downloader": pooch_rattler.Downloader(),
-                "futures": set(),
-                "httpx_client": httpx_client,
-                "locks": _core.WeakValueDictionary(),
-                "statistics": _core.Statistics(
-                    backup_servers=self.upstream.backup,
-                ),
-            }
-
-    @no_type_check
-    def loop_factory(self) -> asyncio.AbstractEventLoop:
-        loop = uvloop.new_event_loop()
-        if self.eager_task_execution:
-            loop.set_task_factory(asyncio.eager_task_factory)
-        return loop
+        ) as dask_client:
+            yield dask_client
 
     def rattler_gateway(self, cache_action: CacheAction) -> rattler.Gateway:
         host = self.server.host
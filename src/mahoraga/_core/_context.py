@@ -15,11 +15,13 @@
 __all__ = [
     "AsyncClient",
     "Context",
+    "Download",
     "Statistics",
     "WeakValueDictionary",
     "cache_action",
     "cached_or_locked",
     "schedule_exit",
+    "simple_cache_key",
 ]
 
 import asyncio
@@ -27,13 +29,20 @@ import collections
 import contextlib
 import contextvars
 import dataclasses
+import functools
+import hashlib
+import http
 import inspect
 import logging
+import math
+import pathlib
+import stat
 import time
 import weakref
 from typing import (
     TYPE_CHECKING,
     Any,
+    Self,
     TypedDict,
     Unpack,
     cast,
@@ -44,9 +53,11 @@ from typing import (
 import aiohttp.typedefs
 import anyio
 import cyares.aiohttp
+import filelock
 import hishel.httpx
 import httpx
 import httpx_aiohttp
+import pydantic
 import pydantic_settings
 import yarl
 from httpx._config import DEFAULT_LIMITS  # ruff: ignore[import-private-name]
@@ -54,19 +65,42 @@ from httpx._config import DEFAULT_LIMITS  # ruff: ignore[import-private-name]
 from mahoraga import _core
 
 if TYPE_CHECKING:
-    from collections.abc import AsyncGenerator, Awaitable
+    from collections.abc import (
+        AsyncGenerator,
+        AsyncIterator,
+        Awaitable,
+        Callable,
+        Coroutine,
+        Iterable,
+        Mapping,
+    )
     from ssl import SSLContext
+    from types import SimpleNamespace
 
     from _typeshed import StrPath, Unused
     from aiohttp.client import (
         _RequestContextManager,  # pyright: ignore[reportPrivateUsage]
         _RequestOptions,  # pyright: ignore[reportPrivateUsage]
     )
+    from aiohttp.client_reqrep import ConnectionKey
+    from aiohttp.tracing import Trace
     from distributed import Client, Future
     from httpx._types import CertTypes
     from pooch_rattler import Downloader
     from rattler.networking.fetch_repo_data import CacheAction
 
+_ALPHA = 0.2
+_COOL_DOWN = 60.
+_DECAY = 3600.
+_DEFAULT_SIZE = 1 << 20
+_FLUSH_INTERVAL = 60.
+_LOCKS = pathlib.Path("locks")
+_MAX_FAILURES = 3
+_MIN_BYTES = 1 << 16
+_MIN_SAMPLES = 20
+_PRIOR_THROUGHPUT = float(1 << 20)
+_PRIOR_TTFB = 1.
+_PROBE_OK = {http.HTTPStatus.OK, http.HTTPStatus.PARTIAL_CONTENT}
 _SUFFIXES = ("anaconda.org", "github.com", "prefix.dev", "pypi.org")
 
 
@@ -104,7 +138,14 @@ class AsyncClient(hishel.httpx.AsyncCacheClient):
             match cache_action.get():
                 case "no-cache":
                     return t.next_transport
-                case "force-cache-only" | "use-cache-only":
+                case "force-cache-only":
+                    # Whether or not it is up to date
+                    return hishel.httpx.AsyncCacheTransport(
+                        _not_implemented,
+                        t.storage,
+                        _allow_stale,
+                    )
+                case "use-cache-only":
                     return hishel.httpx.AsyncCacheTransport(
                         _not_implemented,
                         t.storage,
@@ -114,6 +155,20 @@ class AsyncClient(hishel.httpx.AsyncCacheClient):
                     pass
         return t
 
+    def connections(
+        self,
+    ) -> tuple[collections.Counter[str], collections.Counter[str]]:
+        t = self._transport
+        if isinstance(t, hishel.httpx.AsyncCacheTransport):
+            t = t.next_transport
+        if (
+            isinstance(t, _AiohttpTransport)
+            and isinstance(t.client, aiohttp.ClientSession)
+            and isinstance(connector := t.client.connector, _TCPConnector)
+        ):
+            return connector.usage()
+        return collections.Counter(), collections.Counter()
+
     @override
     @contextlib.asynccontextmanager
     async def stream(
@@ -131,21 +186,44 @@ class AsyncClient(hishel.httpx.AsyncCacheClient):
         s = ctx["statistics"]
         concurrent_requests = s.concurrent_requests
         concurrent_requests[h] += 1
+        opened = s.admit(h)
         async with contextlib.AsyncExitStack() as stack:
             tic = time.monotonic()
+            response = None
+            ttfb = None
+            failed = False
             try:
-                yield await stack.enter_async_context(cm)
+                response = await stack.enter_async_context(cm)
+                if not response.extensions.get("hishel_from_cache"):
+                    ttfb = time.monotonic() - tic
+                    failed = response.is_server_error
+                yield response
+            except httpx.HTTPError:
+                failed = True
+                raise
             finally:
                 toc = time.monotonic()
                 concurrent_requests[h] -= 1
-                if seconds := round(toc - tic):
-                    s.total_seconds[h] += seconds
-                    schedule_exit(stack)
-                    async with ctx["locks"]["statistics.json"]:
-                        await _json.write_text(
-                            s.model_dump_json(exclude=_exclude),
-                            encoding="utf-8",
-                        )
+                nbytes = response.num_bytes_downloaded if response else 0
+                seconds = toc - tic - (ttfb or 0.)
+                s.record(
+                    h,
+                    ttfb=ttfb,
+                    failed=failed,
+                    nbytes=nbytes,
+                    seconds=seconds,
+                )
+                if ttfb is not None:
+                    s.sample(h, ttfb)
+                elif opened is not None and not failed:
+                    s.readmit(h, opened)
+                if response:
+                    ctx["metrics"].upstream(
+                        h,
+                        ttfb=ttfb,
+                        nbytes=nbytes,
+                        seconds=seconds,
+                    )
 
 
 def schedule_exit(stack: contextlib.AsyncExitStack) -> None:
@@ -153,13 +231,208 @@ def schedule_exit(stack: contextlib.AsyncExitStack) -> None:
     stack.push_async_callback(lambda: task)
 
 
-class Statistics(pydantic_settings.BaseSettings, json_file_encoding="utf-8"):
+def simple_cache_key(url: str, accept: str) -> str | None:
+    # A project index is the same on every mirror, store it only once
+    if accept.startswith("application/vnd.pypi.simple.v1+") or (
+        accept == "text/html" and "/simple/" in url
+    ):
+        project = url.rsplit("/", 2)[1]
+        return f"{project}|{accept}"
+    return None
+
+
+class _Score(pydantic.BaseModel):
+    ttfb: float = _PRIOR_TTFB
+    throughput: float = _PRIOR_THROUGHPUT
+    error_rate: float = 0.
+    updated: float = 0.
+    failures: int = 0
+    opened: float = 0.
+
+    def expected_seconds(self, size: int, concurrency: int) -> float:
+        # Older scores regress towards the prior, so that a mirror which
+        # was slow a while ago gets another chance and vice versa
+        weight = math.exp((self.updated - time.time()) / _DECAY)
+        ttfb = weight * self.ttfb + (1 - weight) * _PRIOR_TTFB
+        throughput = (
+            weight * self.throughput + (1 - weight) * _PRIOR_THROUGHPUT
+        )
+        seconds = ttfb + size * (concurrency + 1) / throughput
+        return seconds / (1 - min(weight * self.error_rate, 0.99))
+
+    def tripped(self) -> bool:
+        return (
+            self.failures >= _MAX_FAILURES
+            and time.time() - self.opened < _COOL_DOWN
+        )
+
+
+class _Saved(pydantic.BaseModel):
+    scores: dict[str, _Score] = {}
+
+
+class Statistics(
+    pydantic_settings.BaseSettings,
+    extra="ignore",
+    json_file_encoding="utf-8",
+):
     backup_servers: dict[str, int]
+    hedge_budget: float = 0.
     concurrent_requests: collections.Counter[str] = collections.Counter()
-    total_seconds: collections.Counter[str] = collections.Counter()
+    scores: dict[str, _Score] = {}
+    shared: bool = False
+    _dirty: bool = False
+    _hedges: int = 0
+    _requests: int = 0
+    _ttfb: collections.defaultdict[str, collections.deque[float]] = (
+        pydantic.PrivateAttr(
+            default_factory=lambda: collections.defaultdict(
+                lambda: collections.deque(maxlen=100),
+            ),
+        )
+    )
+
+    def admit(self, host: str) -> float | None:
+        score = self.scores.get(host)
+        if score and score.failures >= _MAX_FAILURES and not score.tripped():
+            # Half-open, keep other requests away until this probe ends
+            opened, score.opened = score.opened, time.time()
+            return opened
+        return None
+
+    def readmit(self, host: str, opened: float) -> None:
+        # The probe ended without an answer from upstream, e.g. lost a
+        # hedge race or served from cache, let the next request probe
+        score = self.scores[host]
+        if score.updated < score.opened:
+            score.opened = opened
+
+    def record(
+        self,
+        host: str,
+        *,
+        ttfb: float | None,
+        failed: bool,
+        nbytes: int,
+        seconds: float,
+    ) -> None:
+        if ttfb is None and not failed:
+            return  # Served from cache
+        self._dirty = True
+        score = self.scores.setdefault(host, _Score())
+        if ttfb is not None:
+            score.ttfb = _ewma(score.ttfb, ttfb)
+        if nbytes >= _MIN_BYTES and seconds > 0:
+            score.throughput = _ewma(score.throughput, nbytes / seconds)
+        score.error_rate = _ewma(score.error_rate, failed)
+        score.updated = time.time()
+        if not failed:
+            score.failures = 0
+            return
+        score.failures += 1
+        if score.failures >= _MAX_FAILURES:
+            if score.failures == _MAX_FAILURES:
+                _logger.warning("Circuit breaker opened for %s", host)
+            score.opened = score.updated
+
+    async def flush(self) -> None:
+        if not (self._dirty or self.shared):
+            return
+        self._dirty = False
+        # Snapshot on the event loop, write and rename off it
+        data = self.model_dump_json(exclude=_exclude)
+        loop = asyncio.get_running_loop()
+        try:
+            if not self.shared:
+                await loop.run_in_executor(None, _replace, _json, data)
+                return
+            scores = await loop.run_in_executor(None, _merge, data)
+        except OSError:
+            self._dirty = True
+            _logger.exception("Failed to save statistics")
+            return
+        # Adopt what other worker processes have seen since
+        for host, score in scores.items():
+            if host not in self.scores or (
+                score.updated > self.scores[host].updated
+            ):
+                self.scores[host] = score
 
-    def key(self, url: str) -> tuple[bool, int, int]:
-        h = httpx.URL(url).host
+    @contextlib.asynccontextmanager
+    async def persist(self) -> AsyncGenerator[Self]:
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(_FLUSH_INTERVAL)
+                await self.flush()
+
+        async with _background(loop()):
+            yield self
+        await self.flush()
+
+    @contextlib.asynccontextmanager
+    async def probe(
+        self,
+        urls: Iterable[str],
+        *,
+        interval: float,
+        budget: int,
+    ) -> AsyncGenerator[None]:
+        # Mirrors are ranked by host, so one URL per host is enough
+        mirrors: dict[str, str] = {}
+        for url in urls:
+            mirrors.setdefault(_host(url), url)
+        if not (interval and budget and mirrors):
+            yield
+            return
+        limit = max(budget // len(mirrors), 1)
+
+        async def loop() -> None:
+            while True:
+                async with aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(force_close=True),
+                    trace_configs=[_probe_trace_config()],
+                    trust_env=True,
+                ) as session:
+                    for host, url in mirrors.items():
+                        await self._probe(session, host, url, limit)
+                await asyncio.sleep(interval)
+
+        async with _background(loop()):
+            yield
+
+    def hedge_delay(self, url: str) -> float | None:
+        # Every primary request counts towards the hedge budget
+        self._requests += 1
+        if self._hedges >= self.hedge_budget * self._requests:
+            return None
+        samples = self._ttfb.get(_host(url))
+        if not samples or len(samples) < _MIN_SAMPLES:
+            return None
+        return sorted(samples)[len(samples) * 95 // 100]
+
+    def hedge(self) -> None:
+        self._hedges += 1
+
+    def sample(self, host: str, ttfb: float) -> None:
+        # Probes pay for a fresh connection every time, keep them out
+        self._ttfb[host].append(ttfb)
+
+    def healthy(self, urls: Iterable[str]) -> set[str]:
+        # Skip mirrors with an open circuit, unless every one has it
+        urls = set(urls)
+        healthy: set[str] = set()
+        for url in urls:
+            score = self.scores.get(_host(url))
+            if not (score and score.tripped()):
+                healthy.add(url)
+        return healthy or urls
+
+    def key(
+        self,
+        url: str,
+        size: int | None = None,
+    ) -> tuple[bool, bool, float]:
+        h = _host(url)
         concurrency = self.concurrent_requests[h]
         try:
             limit = self.backup_servers[h]
@@ -167,7 +440,11 @@ class Statistics(pydantic_settings.BaseSettings, json_file_encoding="utf-8"):
             backup = False
         else:
             backup = concurrency >= limit
-        return backup, concurrency, self.total_seconds[h]
+        score = self.scores.get(h) or _prior
+        return score.tripped(), backup, score.expected_seconds(
+            _DEFAULT_SIZE if size is None else size,
+            concurrency,
+        )
 
     @classmethod
     @override
@@ -183,6 +460,55 @@ class Statistics(pydantic_settings.BaseSettings, json_file_encoding="utf-8"):
             settings_cls, "statistics.json")
         return (init_settings, json_settings)
 
+    async def _probe(
+        self,
+        session: aiohttp.ClientSession,
+        host: str,
+        url: str,
+        limit: int,
+    ) -> None:
+        stamps: dict[str, float] = {}
+        tic = time.monotonic()
+        try:
+            async with session.get(
+                url,
+                headers={"Range": f"bytes=0-{limit - 1}"},
+                allow_redirects=host.endswith(_SUFFIXES),
+                timeout=aiohttp.ClientTimeout(total=60, connect=15),
+                trace_request_ctx=stamps,
+            ) as response:
+                ttfb = time.monotonic() - stamps.get("request", tic)
+                tic = time.monotonic()
+                nbytes = await _read_at_most(response, limit)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            _logger.debug("Failed to probe %s: %r", url, e)
+            self.record(
+                host,
+                ttfb=None,
+                failed=True,
+                nbytes=0,
+                seconds=0.,
+            )
+            return
+        seconds = time.monotonic() - tic
+        _logger.debug(
+            "Probed %s: DNS %.3fs, connect %.3fs, TTFB %.3fs, "
+            "%d bytes in %.3fs",
+            url,
+            stamps.get("dns_end", 0.) - stamps.get("dns_start", 0.),
+            stamps.get("connect_end", 0.) - stamps.get("connect_start", 0.),
+            ttfb,
+            nbytes,
+            seconds,
+        )
+        self.record(
+            host,
+            ttfb=ttfb,
+            failed=response.status not in _PROBE_OK,
+            nbytes=nbytes,
+            seconds=seconds,
+        )
+
 
 class WeakValueDictionary(weakref.WeakValueDictionary[str, asyncio.Lock]):
     @override
@@ -190,41 +516,182 @@ class WeakValueDictionary(weakref.WeakValueDictionary[str, asyncio.Lock]):
         try:
             return super().__getitem__(key)
         except KeyError:
-            self[key] = value = asyncio.Lock()
+            self[key] = value = _Lock()
             return value
 
 
+@dataclasses.dataclass
+class Download:
+    cache_location: pathlib.Path
+    path: pathlib.Path | None = None
+    size: int | None = None
+    written: int = 0
+    done: bool = False
+    succeeded: bool = False
+    _event: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    def start(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._notify()
+
+    def advance(self, n: int) -> None:
+        self.written += n
+        self._notify()
+
+    def succeed(self) -> None:
+        # Called from the executor right after the temporary file has
+        # been moved into place, the waiters are notified by `finish`
+        self.succeeded = True
+
+    def finish(self) -> None:
+        ctx = _core.context.get()
+        downloads = ctx["downloads"]
+        key = str(self.cache_location)
+        if downloads.get(key) is self:
+            del downloads[key]
+        if self.succeeded and not self.done:
+            ctx["index"].touch(key, self.written)
+            ctx["metrics"].cache_result("fill", self.written)
+        self.done = True
+        self._notify()
+
+    async def started(self) -> bool:
+        while not (self.path or self.done):
+            await self._event.wait()
+        return self.path is not None
+
+    async def finished(self) -> None:
+        while not self.done:
+            await self._event.wait()
+
+    async def aiter_bytes(
+        self,
+        start: int = 0,
+        end: int | None = None,
+    ) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        while end is None or start < end:
+            while start >= self.written and not self.done:
+                await self._event.wait()
+            if start < self.written:
+                stop = self.written if end is None else min(self.written, end)
+                chunk = await loop.run_in_executor(
+                    None,
+                    self._read,
+                    start,
+                    min(stop - start, 1 << 20),
+                )
+                start += len(chunk)
+                yield chunk
+            elif self.succeeded:
+                return
+            else:
+                raise EOFError(self.cache_location)
+
+    def _notify(self) -> None:
+        self._event.set()
+        self._event = asyncio.Event()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        for path in self.path, self.cache_location:
+            if not path:
+                continue
+            try:
+                f = path.open("rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset)
+                if chunk := f.read(size):
+                    return chunk
+        raise EOFError(self.cache_location)
+
+
 @overload
 def cached_or_locked(
     cache_location: StrPath,
     stack: None = ...,
+    *,
+    follow: bool = ...,
 ) -> contextlib.AbstractAsyncContextManager[bool]: ...
 
 @overload
 async def cached_or_locked(
     cache_location: StrPath,
     stack: contextlib.AsyncExitStack,
+    *,
+    follow: bool = ...,
 ) -> bool: ...
 
 
 def cached_or_locked(
     cache_location: StrPath,
     stack: contextlib.AsyncExitStack | None = None,
+    *,
+    follow: bool = False,
 ) -> Awaitable[bool] | contextlib.AbstractAsyncContextManager[bool]:
-    cm = _cached_or_locked(cache_location)
+    cm = _cached_or_locked(cache_location, follow=follow)
     return stack.enter_async_context(cm) if stack else cm
 
 
 @contextlib.asynccontextmanager
-async def _cached_or_locked(cache_location: StrPath) -> AsyncGenerator[bool]:
+async def _cached_or_locked(
+    cache_location: StrPath,
+    *,
+    follow: bool,
+) -> AsyncGenerator[bool]:
     ctx = _core.context.get()
-    async with ctx["locks"][str(cache_location)]:
-        if not await anyio.Path(cache_location).is_file():
-            yield False
-            return
+    downloads = ctx["downloads"]
+    key = str(cache_location)
+    if (size := ctx["index"].hit(key)) is not None:
+        # Indexed files are complete, no need to stat or lock
+        ctx["metrics"].cache_result("hit", size)
+        yield True
+        return
+    while True:
+        # The lock only guards the check, a pending download registered
+        # here is what keeps the other requests away from the same file
+        async with ctx["locks"][key]:
+            download = downloads.get(key)
+            if not download:
+                if await _is_cached(key):
+                    break
+                downloads[key] = download = Download(
+                    pathlib.Path(cache_location),
+                )
+                owned = True
+            else:
+                owned = False
+        if owned:
+            try:
+                await _lock_file(download)
+                # Maybe filled by another worker process meanwhile
+                if not await _is_cached(key):
+                    ctx["metrics"].cache_result("miss")
+                    yield False
+                    return
+            finally:
+                if not download.path:
+                    download.finish()
+            break
+        if follow and await download.started():
+            ctx["metrics"].cache_result("hit", download.size or 0)
+            break
+        await download.finished()
     yield True
 
 
+class _Lock(asyncio.Lock):
+    @override
+    async def acquire(self) -> bool:
+        tic = time.monotonic()
+        try:
+            return await super().acquire()
+        finally:
+            metrics = _core.context.get()["metrics"]
+            metrics.lock_wait.observe(time.monotonic() - tic)
+
+
 class _AiohttpTransport(httpx_aiohttp.AiohttpTransport):
     @override
     def get_client(self) -> aiohttp.ClientSession:
@@ -235,9 +702,22 @@ class _AiohttpTransport(httpx_aiohttp.AiohttpTransport):
             or not self.limits.max_connections
         ):
             return super().get_client()
-        connector = aiohttp.TCPConnector(
+        upstream = _core.context.get()["config"].upstream
+        default = (
+            upstream.limit_per_host or self.limits.max_connections,
+            self.limits.keepalive_expiry,
+        )
+        pool = {
+            host: (p.limit or default[0], p.keep_alive or default[1])
+            for host, p in upstream.pool.items()
+        }
+        limits, keep_alives = zip(default, *pool.values(), strict=True)
+        connector = _TCPConnector(
             limit=self.limits.max_connections,
-            keepalive_timeout=self.limits.keepalive_expiry,
+            limit_per_host=max(limits),
+            keepalive_timeout=max(k or 0. for k in keep_alives),
+            default=default,
+            pool=pool,
             ssl=self.ssl_context,
             local_addr=(self.local_address, 0) if self.local_address else None,
             resolver=cyares.aiohttp.CyAresResolver(
@@ -261,6 +741,57 @@ class _AiohttpTransport(httpx_aiohttp.AiohttpTransport):
         )
 
 
+class _TCPConnector(aiohttp.TCPConnector):
+    # Written against the internals of aiohttp 3.13 and 3.14, namely
+    # _acquired_per_host and _conns. The connector-wide limit and
+    # keep-alive are the largest ones, and hosts are narrowed down to
+    # their own here.
+    @override
+    def __init__(
+        self,
+        *,
+        default: tuple[int, float | None],
+        pool: Mapping[str, tuple[int, float | None]],
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._default = default
+        self._pool = pool
+
+    def usage(
+        self,
+    ) -> tuple[collections.Counter[str], collections.Counter[str]]:
+        active = collections.Counter[str]()
+        for key, conns in self._acquired_per_host.items():
+            active[key.host] += len(conns)
+        idle = collections.Counter[str]()
+        for key, conns in self._conns.items():
+            idle[key.host] += len(conns)
+        return active, idle
+
+    @override
+    def _available_connections(self, key: ConnectionKey) -> int:
+        remain = super()._available_connections(key)
+        limit, _ = self._pool.get(key.host, self._default)
+        if acquired := self._acquired_per_host.get(key):
+            return min(remain, limit - len(acquired))
+        return min(remain, limit)
+
+    @override
+    async def _get(
+        self,
+        key: ConnectionKey,
+        traces: list[Trace],
+    ) -> aiohttp.connector.Connection | None:
+        _, keep_alive = self._pool.get(key.host, self._default)
+        if keep_alive is not None and (conns := self._conns.get(key)):
+            deadline = time.monotonic() - keep_alive
+            while conns and conns[0][1] < deadline:
+                proto, _ = conns.popleft()
+                proto.close()
+        return await super()._get(key, traces)
+
+
 class _ClientSession(aiohttp.ClientSession):
     @override
     def request(
@@ -278,6 +809,64 @@ class _ClientSession(aiohttp.ClientSession):
         return super().request(method, url, **kwargs)
 
 
+@contextlib.asynccontextmanager
+async def _background(coro: Coroutine[Any, Any, None]) -> AsyncGenerator[None]:
+    task = asyncio.create_task(coro)
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+def _ewma(average: float, value: float) -> float:
+    return average + _ALPHA * (value - average)
+
+
+@functools.lru_cache(maxsize=1024)
+def _host(url: str) -> str:
+    return httpx.URL(url).host
+
+
+async def _is_cached(key: str) -> bool:
+    ctx = _core.context.get()
+    with contextlib.suppress(OSError):
+        st = await anyio.Path(key).stat()
+        if stat.S_ISREG(st.st_mode):
+            ctx["index"].touch(key, st.st_size)
+            ctx["metrics"].cache_result("hit", st.st_size)
+            return True
+    return False
+
+
+async def _lock_file(download: Download) -> None:
+    # Keeps the worker processes sharing this root from filling the
+    # same file twice, until the download ends. That may be long before
+    # the response does, e.g. on a partial response.
+    digest = hashlib.sha256(str(download.cache_location).encode()).hexdigest()
+    lock = filelock.AsyncFileLock(_LOCKS / digest[:2] / digest)
+    await lock.acquire()
+    futures = _core.context.get()["futures"]
+    task = asyncio.create_task(_release(lock, download))
+    futures.add(task)
+    task.add_done_callback(futures.discard)
+
+
+def _merge(data: str) -> dict[str, _Score]:
+    ours = _Saved.model_validate_json(data).scores
+    with filelock.FileLock(_json.with_name(f"{_json.name}.lock")):
+        try:
+            theirs = _Saved.model_validate_json(_json.read_bytes()).scores
+        except (OSError, pydantic.ValidationError):
+            theirs = {}
+        for host, score in ours.items():
+            if host not in theirs or score.updated > theirs[host].updated:
+                theirs[host] = score
+        _replace(_json, _Saved(scores=theirs).model_dump_json())
+    return theirs
+
+
 async def _on_signal(verb: str) -> None:  # ruff: ignore[unused-async]
     for info in inspect.stack(0):
         match info.frame.f_locals:
@@ -289,14 +878,66 @@ async def _on_signal(verb: str) -> None:  # ruff: ignore[unused-async]
     _core.unreachable()
 
 
+def _probe_trace_config() -> aiohttp.TraceConfig:
+    def stamp(key: str) -> Callable[..., Awaitable[None]]:
+        async def on_signal(  # ruff: ignore[unused-async]
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            _params: object,
+        ) -> None:
+            context.trace_request_ctx[key] = time.monotonic()
+        return on_signal
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(stamp("dns_start"))
+    trace_config.on_dns_resolvehost_end.append(stamp("dns_end"))
+    trace_config.on_connection_create_start.append(stamp("connect_start"))
+    trace_config.on_connection_create_end.append(stamp("connect_end"))
+    trace_config.on_request_headers_sent.append(stamp("request"))
+    return trace_config
+
+
+async def _read_at_most(response: aiohttp.ClientResponse, limit: int) -> int:
+    nbytes = 0
+    async for chunk in response.content.iter_any():
+        nbytes += len(chunk)
+        if nbytes >= limit:
+            break
+    return nbytes
+
+
+async def _release(
+    lock: filelock.BaseAsyncFileLock,
+    download: Download,
+) -> None:
+    try:
+        await download.finished()
+    finally:
+        await _unlock(lock)
+
+
+def _replace(path: pathlib.Path, data: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(data, encoding="utf-8")
+    tmp.replace(path)
+
+
+async def _unlock(lock: filelock.BaseAsyncFileLock) -> None:
+    # Delete the lock file while still holding it, so that the directory
+    # does not keep one per URL. Waiters find its inode unlinked and
+    # start over with a fresh file.
+    with contextlib.suppress(OSError):
+        await anyio.Path(lock.lock_file).unlink()
+    await lock.release()
+
+
 class _AsyncCacheProxy(hishel.AsyncCacheProxy):
     @override
     async def _get_key_for_request(self, request: hishel.Request) -> str:
         if headers := request.headers.get_list("accept"):
             for header in headers:
-                if header.startswith("application/vnd.pypi.simple.v1+"):
-                    project = request.url.rsplit("/", 2)[1]
-                    return f"{project}|{header}"
+                if key := simple_cache_key(request.url, header):
+                    return key
         return await super()._get_key_for_request(request)
 
     @override
@@ -336,11 +977,15 @@ class _AsyncCacheTransport(hishel.httpx.AsyncCacheTransport):
 
 class Context(TypedDict):
     config: _core.Config
-    dask_client: Client
+    dask_client: Client | None
     downloader: Downloader
+    downloads: dict[str, Download]
     futures: set[asyncio.Future[Any] | Future[Any]]
+    http_cache: _core.HttpCache
     httpx_client: AsyncClient
+    index: _core.CacheIndex
     locks: WeakValueDictionary
+    metrics: _core.Metrics
     statistics: Statistics
 
 
@@ -348,7 +993,16 @@ cache_action: contextvars.ContextVar[CacheAction] = contextvars.ContextVar(
     "cache_action",
     default="no-cache",
 )
-_exclude = {"backup_servers", "concurrent_requests"}
-_json = anyio.Path("statistics.json")
+_allow_stale = hishel.SpecificationPolicy(
+    cache_options=hishel.CacheOptions(allow_stale=True),
+)
+_exclude = {
+    "backup_servers",
+    "concurrent_requests",
+    "hedge_budget",
+    "shared",
+}
+_prior = _Score()
+_json = pathlib.Path("statistics.json")
 _logger = logging.getLogger("mahoraga")
 _not_implemented = httpx.AsyncBaseTransport()
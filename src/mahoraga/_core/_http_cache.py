@@ -0,0 +1,231 @@
+# Copyright 2025-2026 hingebase
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+__all__ = ["HttpCache"]
+
+import asyncio
+import collections
+import compression.zstd
+import contextlib
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Self, cast, override
+
+import anysqlite
+import hishel
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, AsyncIterator
+
+_BATCH = 64
+_DATABASE = "http-cache.db"
+_INTERVAL = 60.
+_LOW_WATER = 0.9
+_TTL = 86400.
+
+
+class HttpCache(hishel.AsyncSqliteStorage):
+    def __init__(
+        self,
+        max_size: int = 0,
+        ttl: float = 0.,
+        *,
+        shared: bool = False,
+        evict: bool = True,
+    ) -> None:
+        super().__init__(database_path=_DATABASE, default_ttl=max(ttl, _TTL))
+        self.max_size = max_size
+        self.shared = shared
+        self.evict = evict
+        if not evict:
+            self.last_cleanup = math.inf  # hishel's own TTL cleanup
+        self._accessed: dict[bytes, float] = {}
+        self._not_found: dict[str, float] = {}
+
+    @contextlib.asynccontextmanager
+    async def maintain(self) -> AsyncGenerator[Self]:
+        # hishel enables WAL on its own when the connection is set up
+        self.connection = await anysqlite.connect(_DATABASE)
+        task = asyncio.create_task(self._maintain())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            # The HTTP client closes the connection afterwards
+            with contextlib.suppress(Exception):
+                await self._flush()
+
+    @override
+    async def get_entries(self, key: str) -> list[hishel.Entry]:
+        entries = await super().get_entries(key)
+        if entries:
+            self._accessed[key.encode()] = time.time()
+        return entries
+
+    async def not_found(self, key: str) -> bool:
+        if self._not_found.get(key, 0.) > time.time():
+            return True
+        if not self.shared:
+            return False
+        connection = await self._ensure_connection()
+        cursor = await connection.cursor()
+        await cursor.execute(
+            "SELECT expires FROM mahoraga_not_found "
+            "WHERE key = ? AND expires > ?",
+            (key, time.time()),
+        )
+        if row := await cursor.fetchone():
+            self._not_found[key] = row[0]
+            return True
+        return False
+
+    async def remember_not_found(self, key: str, ttl: float) -> None:
+        self._not_found[key] = expires = time.time() + ttl
+        if not self.shared:
+            return
+        # Also kept here so that every worker process sees it at once
+        connection = await self._ensure_connection()
+        cursor = await connection.cursor()
+        await cursor.execute(
+            "INSERT OR REPLACE INTO mahoraga_not_found VALUES (?, ?)",
+            (key, expires),
+        )
+        await connection.commit()
+
+    async def _evict(self, now: float) -> None:
+        connection = await self._ensure_connection()
+        cursor = await connection.cursor()
+        await cursor.execute(
+            "DELETE FROM mahoraga_not_found WHERE expires <= ?",
+            (now,),
+        )
+        await connection.commit()
+        if not self.max_size:
+            return
+        target = int(self.max_size * _LOW_WATER)
+        count = 0
+        async with self._write_lock:
+            while await self._used(cursor) > target:
+                await cursor.execute(
+                    "SELECT entries.id FROM entries "
+                    "LEFT JOIN mahoraga_access USING (cache_key) "
+                    "ORDER BY COALESCE(accessed_at, created_at) LIMIT ?",
+                    (_BATCH,),
+                )
+                if not (rows := await cursor.fetchall()):
+                    break
+                # Stream chunks go along via ON DELETE CASCADE
+                await cursor.executemany(
+                    "DELETE FROM entries WHERE id = ?",
+                    rows,
+                )
+                await connection.commit()
+                count += len(rows)
+            await cursor.execute(
+                "DELETE FROM mahoraga_access WHERE cache_key NOT IN "
+                "(SELECT cache_key FROM entries)",
+            )
+            await connection.commit()
+        if count:
+            _logger.info("Evicted %d HTTP cache entries", count)
+
+    async def _flush(self) -> None:
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        connection = await self._ensure_connection()
+        cursor = await connection.cursor()
+        await cursor.executemany(
+            "INSERT OR REPLACE INTO mahoraga_access VALUES (?, ?)",
+            accessed.items(),
+        )
+        await connection.commit()
+
+    @override
+    async def _initialize_database(self) -> None:
+        await super()._initialize_database()
+        # Called by `_ensure_connection` itself, with the connection set
+        connection = cast("anysqlite.Connection", self.connection)
+        cursor = await connection.cursor()
+        await cursor.execute(
+            "CREATE TABLE IF NOT EXISTS mahoraga_access ("
+            "cache_key BLOB PRIMARY KEY, accessed_at REAL NOT NULL)",
+        )
+        await cursor.execute(
+            "CREATE TABLE IF NOT EXISTS mahoraga_not_found ("
+            "key TEXT PRIMARY KEY, expires REAL NOT NULL)",
+        )
+        await connection.commit()
+
+    async def _maintain(self) -> None:
+        while True:
+            now = time.time()
+            self._not_found = {
+                key: expires
+                for key, expires in self._not_found.items()
+                if expires > now
+            }
+            try:
+                await self._flush()
+                if self.evict:
+                    await self._evict(now)
+            except Exception:
+                _logger.exception("Failed to maintain the HTTP cache")
+            await asyncio.sleep(_INTERVAL)
+
+    @override
+    async def _save_stream(
+        self,
+        stream: AsyncIterator[bytes],
+        entry_id: bytes,
+    ) -> AsyncIterator[bytes]:
+        # Store a single zstd frame while passing the plain bytes on
+        compressor = compression.zstd.ZstdCompressor()
+        plain: collections.deque[bytes] = collections.deque()
+
+        async def compress() -> AsyncIterator[bytes]:
+            async for chunk in stream:
+                plain.append(chunk)
+                yield compressor.compress(chunk)
+            yield compressor.flush()
+
+        async for _ in super()._save_stream(compress(), entry_id):
+            while plain:
+                yield plain.popleft()
+
+    @override
+    async def _stream_data_from_cache(
+        self,
+        entry_id: bytes,
+    ) -> AsyncIterator[bytes]:
+        decompressor = compression.zstd.ZstdDecompressor()
+        async for chunk in super()._stream_data_from_cache(entry_id):
+            if data := decompressor.decompress(chunk):
+                yield data
+
+    @staticmethod
+    async def _used(cursor: anysqlite.Cursor) -> int:
+        # Freed pages are reused by later writes, so only count the rest
+        await cursor.execute(
+            "SELECT (page_count - freelist_count) * page_size "
+            "FROM pragma_page_count, pragma_freelist_count, pragma_page_size",
+        )
+        [used] = await cursor.fetchone()
+        return used
+
+
+_logger = logging.getLogger("mahoraga")
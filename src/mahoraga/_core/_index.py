@@ -0,0 +1,270 @@
+# Copyright 2025-2026 hingebase
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+__all__ = ["ROOTS", "CacheIndex", "blob_path"]
+
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import logging
+import operator
+import os
+import pathlib
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from mahoraga import _core
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Mapping
+
+ROOTS = (
+    "channels",
+    "npm",
+    "packages",
+    "pyodide",
+    "python-build-standalone",
+    "uv",
+)
+_BLOBS = pathlib.Path("blobs", "sha256")
+_GRACE = 300.
+_INTERVAL = 60.
+_LOW_WATER = 0.9
+
+
+class _Entry(NamedTuple):
+    size: int
+    access: float
+    saved: float  # Access time last written to the file
+
+
+@dataclasses.dataclass
+class CacheIndex:
+    max_size: int = 0
+    quota: Mapping[str, int] = dataclasses.field(default_factory=dict)
+    shared: bool = False
+    _entries: collections.OrderedDict[str, _Entry] = dataclasses.field(
+        default_factory=collections.OrderedDict,
+        init=False,
+    )
+    _usage: collections.Counter[str] = dataclasses.field(
+        default_factory=collections.Counter,
+        init=False,
+    )
+    _scanned: bool = dataclasses.field(default=False, init=False)
+    _wakeup: asyncio.Event = dataclasses.field(
+        default_factory=asyncio.Event,
+        init=False,
+    )
+
+    def touch(self, key: str, size: int) -> None:
+        self.discard(key)
+        now = time.time()
+        self._entries[key] = _Entry(size, now, now)
+        self._usage[""] += size
+        self._usage[_root(key)] += size
+        if self._scanned and self._over_quota():
+            self._wakeup.set()
+
+    def hit(self, key: str) -> int | None:
+        if entry := self._entries.get(key):
+            now = time.time()
+            if now - entry.saved < _INTERVAL:
+                self._entries[key] = entry._replace(access=now)
+            else:
+                # Kept in the file across restarts and worker processes
+                self._entries[key] = _Entry(entry.size, now, now)
+                loop = asyncio.get_running_loop()
+                loop.run_in_executor(None, _utime, key)
+            self._entries.move_to_end(key)
+            return entry.size
+        return None
+
+    def discard(self, key: str) -> None:
+        if entry := self._entries.pop(key, None):
+            self._usage[""] -= entry.size
+            self._usage[_root(key)] -= entry.size
+
+    @contextlib.asynccontextmanager
+    async def maintain(self, ctx: _core.Context) -> AsyncGenerator[None]:
+        task = asyncio.create_task(self._maintain(ctx))
+        try:
+            yield
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _evict(self, ctx: _core.Context) -> None:
+        targets = {
+            scope: int(limit * _LOW_WATER)
+            for scope, limit in [("", self.max_size), *self.quota.items()]
+            if limit and self._usage[scope] > limit
+        }
+        loop = asyncio.get_running_loop()
+        deadline = time.time() - _GRACE
+        count = freed = 0
+        for key, entry in list(self._entries.items()):
+            if not targets:
+                break
+            if entry.access > deadline:
+                break  # Everything after this was used just now
+            scope = _root(key)
+            if scope not in targets and "" not in targets:
+                continue
+            async with ctx["locks"][key]:
+                if key in ctx["downloads"] or self._entries.get(key) != entry:
+                    continue
+                # Hits bypass the lock, send them to the slow path first
+                self.discard(key)
+                size = await loop.run_in_executor(
+                    None,
+                    _unlink,
+                    key,
+                    entry.access,
+                )
+            if size is not None:
+                # Rewritten or used elsewhere since we last saw it
+                self.touch(key, size)
+                continue
+            count += 1
+            freed += entry.size
+            for scope in list(targets):
+                if self._usage[scope] <= targets[scope]:
+                    del targets[scope]
+        if count:
+            freed += await loop.run_in_executor(None, _collect_blobs)
+            _logger.info("Evicted %d cached files, %d bytes", count, freed)
+
+    async def _maintain(self, ctx: _core.Context) -> None:
+        _core.context.set(ctx)
+        loop = asyncio.get_running_loop()
+        for key, size, access in sorted(
+            await loop.run_in_executor(None, _scan),
+            key=operator.itemgetter(2),
+            reverse=True,
+        ):
+            # Files touched during the scan are more recent than any
+            if key not in self._entries:
+                self._entries[key] = _Entry(size, access, access)
+                self._entries.move_to_end(key, last=False)
+                self._usage[""] += size
+                self._usage[_root(key)] += size
+        self._scanned = True
+        await loop.run_in_executor(None, _collect_blobs)
+        if not (self.max_size or any(self.quota.values())):
+            return
+        while True:
+            if self.shared:
+                try:
+                    await self._rescan(ctx)
+                except Exception:
+                    _logger.exception("Failed to rescan cached files")
+            if self._over_quota():
+                try:
+                    await self._evict(ctx)
+                except Exception:
+                    _logger.exception("Failed to evict cached files")
+            self._wakeup.clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), _INTERVAL)
+
+    async def _rescan(self, ctx: _core.Context) -> None:
+        # Other worker processes fill the cache too, count their files
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(None, _scan)
+        for key, size, access in sorted(found, key=operator.itemgetter(2)):
+            if key not in self._entries:
+                self._entries[key] = _Entry(size, access, access)
+                self._usage[""] += size
+                self._usage[_root(key)] += size
+        # And forget those they deleted
+        gone = self._entries.keys() - {key for key, _, _ in found}
+        for key in gone - ctx["downloads"].keys():
+            self.discard(key)
+
+    def _over_quota(self) -> bool:
+        return any(
+            limit and self._usage[scope] > limit
+            for scope, limit in [("", self.max_size), *self.quota.items()]
+        )
+
+
+def blob_path(sha256: bytes) -> pathlib.Path:
+    hexdigest = sha256.hex()
+    return _BLOBS / hexdigest[:2] / hexdigest[2:4] / hexdigest
+
+
+def _collect_blobs() -> int:
+    # A blob no longer linked from any cache path is garbage
+    freed = 0
+    for dirpath, _, filenames in _BLOBS.walk():
+        for name in filenames:
+            path = dirpath / name
+            with contextlib.suppress(OSError):
+                st = path.stat()
+                if st.st_nlink == 1:
+                    path.unlink()
+                    freed += st.st_size
+    return freed
+
+
+def _root(key: str) -> str:
+    return key.split(os.sep, 1)[0]
+
+
+def _scan() -> list[tuple[str, int, float]]:
+    found: list[tuple[str, int, float]] = []
+    for root in ROOTS:
+        for dirpath, _, filenames in pathlib.Path(root).walk():
+            for name in filenames:
+                if name.endswith(".msgpack.zst"):
+                    continue  # Sharded repodata, regenerated every hour
+                path = dirpath / name
+                with contextlib.suppress(OSError):
+                    st = path.stat()
+                    access = max(st.st_atime, st.st_mtime)
+                    found.append((str(path), st.st_size, access))
+    return found
+
+
+def _unlink(key: str, access: float) -> int | None:
+    path = pathlib.Path(key)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    if st.st_mtime > access or st.st_atime > access + _INTERVAL:
+        return st.st_size
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # Probably opened by someone else on Windows, try again later
+        _logger.debug("Failed to evict %s: %r", key, e)
+        return st.st_size
+    return None
+
+
+def _utime(key: str) -> None:
+    # Only the access time, the modification time makes up the ETag
+    with contextlib.suppress(OSError):
+        path = pathlib.Path(key)
+        st = path.stat()
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+
+
+_logger = logging.getLogger("mahoraga")
@@ -0,0 +1,290 @@
+# Copyright 2025-2026 hingebase
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+__all__ = ["Metrics"]
+
+import asyncio
+import bisect
+import collections
+import contextlib
+import dataclasses
+import itertools
+from typing import TYPE_CHECKING, Literal, Self
+
+from mahoraga import _core
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Iterable, Iterator, Mapping
+
+_LOOP_INTERVAL = 1.
+_MIN_BYTES = 1 << 16
+_ROUTERS = {"parselmouth": "conda", "python-build-standalone": "python"}
+_SECONDS = (.001, .005, .01, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+_SHARD_SECONDS = (1., 5., 10., 30., 60., 120., 300., 600., 1800., 3600.)
+_THROUGHPUT = tuple(float(1 << n) for n in range(16, 31, 2))
+
+
+@dataclasses.dataclass
+class _Histogram:
+    buckets: tuple[float, ...]
+    counts: list[int] = dataclasses.field(init=False)
+    sum: float = 0.
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        if (i := bisect.bisect_left(self.buckets, value)) < len(self.buckets):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, labels: str) -> Iterator[str]:
+        sep = "," if labels else ""
+        for le, n in zip(
+            self.buckets,
+            itertools.accumulate(self.counts),
+            strict=True,
+        ):
+            yield f'_bucket{{{labels}{sep}le="{le}"}} {n}'
+        yield f'_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        braces = f"{{{labels}}}" if labels else ""
+        yield f"_sum{braces} {self.sum}"
+        yield f"_count{braces} {self.count}"
+
+
+@dataclasses.dataclass
+class Metrics:
+    cache: collections.Counter[tuple[str, str]] = dataclasses.field(
+        default_factory=collections.Counter,
+    )
+    cache_bytes: collections.Counter[tuple[str, str]] = dataclasses.field(
+        default_factory=collections.Counter,
+    )
+    hishel: collections.Counter[str] = dataclasses.field(
+        default_factory=collections.Counter,
+    )
+    ttfb: collections.defaultdict[str, _Histogram] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(
+            lambda: _Histogram(_SECONDS),
+        ),
+    )
+    throughput: collections.defaultdict[str, _Histogram] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(
+            lambda: _Histogram(_THROUGHPUT),
+        ),
+    )
+    lock_wait: _Histogram = dataclasses.field(
+        default_factory=lambda: _Histogram(_SECONDS),
+    )
+    loop_lag: _Histogram = dataclasses.field(
+        default_factory=lambda: _Histogram(_SECONDS),
+    )
+    shards: collections.defaultdict[tuple[str, str], _Histogram] = (
+        dataclasses.field(
+            default_factory=lambda: collections.defaultdict(
+                lambda: _Histogram(_SHARD_SECONDS),
+            ),
+        )
+    )
+    worker: int | None = None
+
+    def cache_result(
+        self,
+        result: Literal["hit", "miss", "fill"],
+        nbytes: int = 0,
+    ) -> None:
+        key = _router(), result
+        self.cache[key] += 1
+        self.cache_bytes[key] += nbytes
+
+    def upstream(
+        self,
+        host: str,
+        *,
+        ttfb: float | None,
+        nbytes: int,
+        seconds: float,
+    ) -> None:
+        if ttfb is None:
+            self.hishel["hit"] += 1
+            return
+        self.hishel["miss"] += 1
+        self.ttfb[host].observe(ttfb)
+        if nbytes >= _MIN_BYTES and seconds > 0:
+            self.throughput[host].observe(nbytes / seconds)
+
+    @contextlib.asynccontextmanager
+    async def monitor(self) -> AsyncGenerator[Self]:
+        task = asyncio.create_task(self._monitor())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def render(self, client: _core.AsyncClient) -> str:
+        active, idle = client.connections()
+        # A scrape reaches one worker process, keep their series apart
+        w = "" if self.worker is None else _labels(worker=str(self.worker))
+        lines = [
+            *_counter(
+                "mahoraga_cache_requests_total",
+                "Cache lookups and fills per router.",
+                {
+                    _labels(router=r, result=s): n
+                    for (r, s), n in self.cache.items()
+                },
+                extra=w,
+            ),
+            *_counter(
+                "mahoraga_cache_bytes_total",
+                "Bytes served from or written to the cache per router.",
+                {
+                    _labels(router=r, result=s): n
+                    for (r, s), n in self.cache_bytes.items()
+                },
+                extra=w,
+            ),
+            *_counter(
+                "mahoraga_http_cache_responses_total",
+                "Upstream responses served by the HTTP cache or not.",
+                {_labels(result=k): n for k, n in self.hishel.items()},
+                extra=w,
+            ),
+            *_histogram(
+                "mahoraga_upstream_ttfb_seconds",
+                "Time to first byte of upstream responses.",
+                {_labels(host=h): v for h, v in self.ttfb.items()},
+                extra=w,
+            ),
+            *_histogram(
+                "mahoraga_upstream_throughput_bytes_per_second",
+                "Throughput of upstream response bodies.",
+                {_labels(host=h): v for h, v in self.throughput.items()},
+                extra=w,
+            ),
+            *_gauge(
+                "mahoraga_upstream_connections",
+                "Upstream connections per host.",
+                {
+                    _labels(host=h, state=s): n
+                    for s, c in (("active", active), ("idle", idle))
+                    for h, n in c.items()
+                },
+                extra=w,
+            ),
+            *_histogram(
+                "mahoraga_lock_wait_seconds",
+                "Time spent waiting for internal locks.",
+                {"": self.lock_wait},
+                extra=w,
+            ),
+            *_histogram(
+                "mahoraga_event_loop_lag_seconds",
+                "Delay of timer callbacks in the event loop.",
+                {"": self.loop_lag},
+                extra=w,
+            ),
+            *_histogram(
+                "mahoraga_shard_generation_seconds",
+                "Time spent on generating sharded repodata.",
+                {
+                    _labels(channel=c, platform=p): v
+                    for (c, p), v in self.shards.items()
+                },
+                extra=w,
+            ),
+        ]
+        lines.append("")
+        return "\n".join(lines)
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            tic = loop.time()
+            await asyncio.sleep(_LOOP_INTERVAL)
+            self.loop_lag.observe(max(loop.time() - tic - _LOOP_INTERVAL, 0.))
+
+
+def _counter(
+    name: str,
+    help_: str,
+    samples: Mapping[str, int],
+    *,
+    extra: str,
+) -> Iterable[str]:
+    return _scalars(name, help_, "counter", samples, extra=extra)
+
+
+def _gauge(
+    name: str,
+    help_: str,
+    samples: Mapping[str, int],
+    *,
+    extra: str,
+) -> Iterable[str]:
+    return _scalars(name, help_, "gauge", samples, extra=extra)
+
+
+def _histogram(
+    name: str,
+    help_: str,
+    samples: Mapping[str, _Histogram],
+    *,
+    extra: str,
+) -> Iterable[str]:
+    yield f"# HELP {name} {help_}"
+    yield f"# TYPE {name} histogram"
+    for labels, histogram in sorted(samples.items()):
+        for sample in histogram.samples(_join(extra, labels)):
+            yield name + sample
+
+
+def _join(*labels: str) -> str:
+    return ",".join(filter(None, labels))
+
+
+def _labels(**kwargs: str) -> str:
+    return ",".join(
+        '{}="{}"'.format(
+            k,
+            v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for k, v in kwargs.items()
+    )
+
+
+def _scalars(
+    name: str,
+    help_: str,
+    type_: str,
+    samples: Mapping[str, int],
+    *,
+    extra: str,
+) -> Iterable[str]:
+    yield f"# HELP {name} {help_}"
+    yield f"# TYPE {name} {type_}"
+    for key, value in sorted(samples.items()):
+        labels = _join(extra, key)
+        yield f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+def _router() -> str:
+    if request := _core.request.get():
+        segment = request.scope["path"].split("/", 2)[1]
+        return _ROUTERS.get(segment, segment)
+    return ""
@@ -14,6 +14,7 @@
 
 __all__ = [
     "APIRoute",
+    "FileResponse",
     "Response",
     "StreamingResponse",
     "get",
@@ -22,22 +23,38 @@ __all__ = [
 ]
 
 import asyncio
+import collections
+import concurrent.futures
 import contextlib
+import functools
 import hashlib
 import http
 import logging
 import pathlib
+import re
+import secrets
 import shutil
 from collections.abc import (
     AsyncGenerator,
     AsyncIterator,
     Callable,
+    Collection,
     Coroutine,
     Generator,
     Iterable,
+    Iterator,
     Mapping,
 )
-from typing import TYPE_CHECKING, Any, TypedDict, Unpack, overload, override
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    NamedTuple,
+    TypedDict,
+    Unpack,
+    cast,
+    overload,
+    override,
+)
 
 import anyio
 import fastapi.responses
@@ -45,14 +62,19 @@ import fastapi.routing
 import hishel.fastapi
 import httpx
 import pooch.utils  # pyright: ignore[reportMissingTypeStubs]
+import starlette.datastructures
+import starlette.responses
 
 from mahoraga import _core
 
 if TYPE_CHECKING:
+    import os
     from _hashlib import HASH
+    from io import FileIO
     from types import TracebackType
 
-    from _typeshed import ReadableBuffer, StrPath
+    from _typeshed import StrPath
+    from starlette.types import Receive, Scope, Send
 
 hourly = [
     hishel.fastapi.cache(max_age=3600),
@@ -70,6 +92,11 @@ class APIRoute(fastapi.routing.APIRoute):
     ]:
         async def wrapper(request: fastapi.Request) -> fastapi.Response:
             match response := await wrapped(request):
+                case FileResponse() if "mahoraga.retry" not in request.scope:
+                    # At most once, see `FileResponse._send_file`
+                    request.scope["mahoraga.retry"] = True
+                    response.retry = functools.partial(wrapper, request)
+                    _get_stack(request).push(_wrap_file_not_found_error)
                 case fastapi.responses.FileResponse():
                     _get_stack(request).push(_wrap_file_not_found_error)
                 case fastapi.responses.StreamingResponse(
@@ -98,22 +125,157 @@ class StreamingResponse(fastapi.responses.StreamingResponse, Response):
     media_type = "application/octet-stream"
 
 
+class FileResponse(fastapi.responses.FileResponse):
+    # Servers supporting http.response.pathsend (granian) never read the
+    # file in Python, others (uvicorn) benefit from fewer, larger chunks
+    chunk_size = 1 << 20
+    retry: Callable[[], Coroutine[Any, Any, fastapi.Response]] | None = None
+
+    @override
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+    ) -> None:
+        super().__init__(path, status_code, headers, media_type)
+        ctx = _core.context.get()
+        download = ctx["downloads"].get(str(path))
+        self.download = download if download and download.path else None
+        self.index = ctx["index"]
+        self.x_accel_redirect = (
+            _x_accel_redirect(path)
+            if ctx["config"].server.x_accel_redirect
+            else None
+        )
+
+    @override
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        download = self.download
+        if not download or download.done:
+            if uri := self.x_accel_redirect:
+                # Nginx and Caddy take care of ranges and conditionals
+                response = fastapi.Response(
+                    status_code=self.status_code,
+                    headers={**self.headers, "X-Accel-Redirect": uri},
+                )
+                await response(scope, receive, send)
+            else:
+                await self._send_file(scope, receive, send)
+            return
+        try:
+            ranges = self._ranges(scope, download.size)
+        except starlette.responses.MalformedRangeHeader as e:
+            response = fastapi.responses.PlainTextResponse(e.content, 400)
+            await response(scope, receive, send)
+            return
+        except starlette.responses.RangeNotSatisfiable as e:
+            response = fastapi.responses.PlainTextResponse(
+                status_code=http.HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": f"bytes */{e.max_size}"},
+            )
+            await response(scope, receive, send)
+            return
+        headers = self.headers.mutablecopy()
+        status_code = http.HTTPStatus.PARTIAL_CONTENT
+        media_type = self.media_type
+        match ranges:
+            case None:
+                del headers["Accept-Ranges"]
+                status_code = self.status_code
+                content = download.aiter_bytes()
+            case []:
+                headers["Content-Length"] = str(download.size)
+                status_code = self.status_code
+                content = download.aiter_bytes()
+            case [(start, end)]:
+                headers["Content-Length"] = str(end - start)
+                headers["Content-Range"] = (
+                    f"bytes {start}-{end - 1}/{download.size}"
+                )
+                content = download.aiter_bytes(start, end)
+            case _:
+                boundary = secrets.token_hex(13)
+                content_length, header = self.generate_multipart(
+                    ranges,
+                    boundary,
+                    cast("int", download.size),
+                    headers["Content-Type"],
+                )
+                headers["Content-Length"] = str(content_length)
+                media_type = f"multipart/byteranges; boundary={boundary}"
+                content = _multipart_byteranges(
+                    download,
+                    ranges,
+                    boundary,
+                    header,
+                )
+        async with contextlib.aclosing(content):
+            response = StreamingResponse(
+                content,
+                status_code,
+                headers,
+                media_type,
+            )
+            await response(scope, receive, send)
+
+    async def _send_file(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        except RuntimeError as e:
+            # Evicted by another worker process after we indexed it,
+            # nothing has been sent yet
+            missing = isinstance(e.__context__, FileNotFoundError)
+            if not (self.retry and missing):
+                raise
+            self.index.discard(str(self.path))
+            response = await self.retry()
+            await response(scope, receive, send)
+
+    def _ranges(
+        self,
+        scope: Scope,
+        size: int | None,
+    ) -> list[tuple[int, int]] | None:
+        if size is None:
+            return None
+        headers = starlette.datastructures.Headers(scope=scope)
+        if (
+            self.status_code != http.HTTPStatus.OK
+            or "If-Range" in headers  # Validators are unknown until cached
+            or not (http_range := headers.get("Range"))
+        ):
+            return []
+        return self._parse_range_header(http_range, size)
+
+
 async def get(urls: Iterable[str], **kwargs: object) -> bytes:
-    ctx = _core.context.get()
-    client = ctx["httpx_client"]
+    if not isinstance(urls, str):
+        urls = frozenset(urls)
+    if await _not_found(urls):
+        raise fastapi.HTTPException(http.HTTPStatus.NOT_FOUND)
     response = None
+    misses = _skipped(urls)
     async with contextlib.AsyncExitStack() as stack:
-        for url in load_balance(urls):
-            try:
-                response = await stack.enter_async_context(
-                    client.stream("GET", url, **kwargs),
-                )
-            except httpx.HTTPError:
-                continue
+        mirrors = load_balance(urls)
+        while opened := await _open(stack, mirrors, **kwargs):
+            response = opened
             try:
                 response.raise_for_status()
             except httpx.HTTPStatusError:
                 _core.schedule_exit(stack)
+                misses += response.status_code == http.HTTPStatus.NOT_FOUND
                 continue
             try:
                 return await response.aread()
@@ -121,6 +283,7 @@ async def get(urls: Iterable[str], **kwargs: object) -> bytes:
                 _core.schedule_exit(stack)
     if not response:
         raise fastapi.HTTPException(http.HTTPStatus.GATEWAY_TIMEOUT)
+    await _remember_not_found(urls, misses)
     headers = response.headers
     for key in "Date", "Server":
         headers.pop(key, None)
@@ -166,6 +329,11 @@ async def stream(
     stack: contextlib.AsyncExitStack | None = None,
     **kwargs: Unpack[_CacheOptions],
 ) -> fastapi.Response:
+    if not isinstance(urls, str):
+        urls = frozenset(urls)
+    if await _not_found(urls):
+        return fastapi.Response(status_code=http.HTTPStatus.NOT_FOUND)
+    headers = _with_range(headers)
     if stack:
         return await _entered(
             stack,
@@ -185,10 +353,134 @@ async def stream(
     return _core.unreachable()
 
 
+class _EncodedStreamingResponse(StreamingResponse):
+    @override
+    def init_headers(self, headers: Mapping[str, str] | None = None) -> None:
+        headers = httpx.Headers(headers)
+        content_encoding = headers["Content-Encoding"]
+        super().init_headers(headers)
+        self.raw_headers.append(
+            (b"content-encoding", content_encoding.encode("latin-1")),
+        )
+        if "Vary" not in headers:
+            self.raw_headers.append((b"vary", b"Accept-Encoding"))
+
+
+class _Opened(NamedTuple):
+    response: httpx.Response
+    stack: contextlib.AsyncExitStack
+
+
 class _ContentLengthError(Exception):
     pass
 
 
+class _SegmentedError(Exception):
+    pass
+
+
+class _Pieces:
+    def __init__(
+        self,
+        download: _core.Download,
+        path: pathlib.Path,
+        piece_size: int,
+    ) -> None:
+        size = cast("int", download.size)
+        self.download = download
+        self.path = path
+        self.piece_size = piece_size
+        self.reached = list(range(0, size, piece_size))
+        self.todo = collections.deque(range(len(self.reached)))
+        self._first = 0
+
+    def take(self) -> int | None:
+        return self.todo.popleft() if self.todo else None
+
+    def put_back(self, piece: int) -> None:
+        self.todo.appendleft(piece)
+
+    def span(self, piece: int) -> tuple[int, int]:
+        size = cast("int", self.download.size)
+        return self.reached[piece], min((piece + 1) * self.piece_size, size)
+
+    def advance(self, piece: int, offset: int) -> None:
+        self.reached[piece] = offset
+        reached = self.reached
+        while self._first < len(reached):
+            start, end = self.span(self._first)
+            if start < end:
+                break
+            self._first += 1
+        download = self.download
+        written = (
+            reached[self._first]
+            if self._first < len(reached)
+            else cast("int", download.size)
+        )
+        if written > download.written:
+            if not download.path:
+                download.start(self.path)
+            download.advance(written - download.written)
+
+
+class _Writer:
+    def __init__(
+        self,
+        f: FileIO,
+        download: _core.Download,
+        hash_: HASH,
+    ) -> None:
+        self.f = f
+        self.download = download
+        self.hash = hash_
+        self.batch: list[bytes] = []
+        self.buffered = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            1,
+            "mahoraga-writer",
+        )
+        self.pending: collections.deque[asyncio.Future[int]] = (
+            collections.deque()
+        )
+        self.submitted = 0.
+
+    async def write(self, data: bytes) -> None:
+        self.batch.append(data)
+        self.buffered += len(data)
+        loop = asyncio.get_running_loop()
+        if (
+            self.buffered >= _BATCH_SIZE
+            or loop.time() - self.submitted >= _BATCH_DELAY
+        ):
+            await self.flush(wait=False)
+
+    async def flush(self, *, wait: bool = True) -> None:
+        if batch := self.batch:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self.executor, self._write, batch)
+            fut.add_done_callback(self._advance)
+            self.pending.append(fut)
+            self.batch = []
+            self.buffered = 0
+            self.submitted = loop.time()
+        while self.pending and (wait or len(self.pending) > _MAX_PENDING):
+            await self.pending.popleft()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def _write(self, batch: list[bytes]) -> int:
+        data = b"".join(batch)
+        # hashlib releases the GIL for large buffers
+        self.hash.update(data)
+        return self.f.write(data)
+
+    def _advance(self, fut: asyncio.Future[int]) -> None:
+        if not fut.cancelled() and not fut.exception():
+            self.download.advance(fut.result())
+
+
 async def _entered(
     stack: contextlib.AsyncExitStack,
     urls: Iterable[str],
@@ -197,32 +489,37 @@ async def _entered(
     media_type: str | None = None,
     **kwargs: Unpack[_CacheOptions],
 ) -> fastapi.Response:
-    ctx = _core.context.get()
-    client = ctx["httpx_client"]
+    if response := await _from_blob(media_type, kwargs):
+        return response
+    if response := await _segmented(stack, urls, headers, media_type, kwargs):
+        return response
     inner_stack = await stack.enter_async_context(contextlib.AsyncExitStack())
     response = None
-    for url in load_balance(urls):
-        try:
-            response = await inner_stack.enter_async_context(
-                client.stream("GET", url, headers=headers),
-            )
-        except httpx.HTTPError:
-            continue
+    misses = _skipped(urls)
+    mirrors = load_balance(urls, kwargs.get("size"))
+    while opened := await _open(inner_stack, mirrors, headers=headers):
+        response = opened
         if response.status_code == http.HTTPStatus.NOT_MODIFIED:
             break
         try:
             response.raise_for_status()
         except httpx.HTTPStatusError:
             _core.schedule_exit(inner_stack)
+            misses += response.status_code == http.HTTPStatus.NOT_FOUND
             continue
+        kwargs = _cache_options(response, kwargs)
         try:
-            headers = _unify_content_length(response.headers, kwargs)
+            response_headers = _unify_content_length(response.headers, kwargs)
         except _ContentLengthError:
             _core.schedule_exit(inner_stack)
             response = None
             continue
         new_stack = contextlib.AsyncExitStack()
-        content = _stream(response, new_stack, **kwargs)
+        content = _stream(
+            _chunks(response, response_headers, mirrors, headers, kwargs),
+            new_stack,
+            **kwargs,
+        )
         try:
             if await anext(content):
                 _core.unreachable()
@@ -231,13 +528,19 @@ async def _entered(
             response = None
             continue
         await new_stack.enter_async_context(stack.pop_all())
-        return StreamingResponse(
+        response_class = (
+            _EncodedStreamingResponse
+            if "Content-Encoding" in response_headers
+            else StreamingResponse
+        )
+        return response_class(
             content,
             response.status_code,
-            headers,
+            response_headers,
             media_type,
         )
     if response:
+        await _remember_not_found(urls, misses)
         headers = response.headers
         headers.pop("Content-Length", None)
         return Response(
@@ -247,13 +550,16 @@ async def _entered(
     return fastapi.Response(status_code=http.HTTPStatus.GATEWAY_TIMEOUT)
 
 
-def load_balance(urls: Iterable[str]) -> Generator[str]:
+def load_balance(
+    urls: Iterable[str],
+    size: int | None = None,
+) -> Generator[str]:
     if isinstance(urls, str):
         urls = {urls}
     else:
         ctx = _core.context.get()
-        key = ctx["statistics"].key
-        urls = set(urls)
+        key = functools.partial(ctx["statistics"].key, size=size)
+        urls = ctx["statistics"].healthy(urls)
         while len(urls) > 1:
             url = min(urls, key=key)
             yield url
@@ -262,6 +568,172 @@ def load_balance(urls: Iterable[str]) -> Generator[str]:
         yield url
 
 
+def _cache_options(
+    response: httpx.Response,
+    kwargs: _CacheOptions,
+) -> _CacheOptions:
+    if response.status_code != http.HTTPStatus.PARTIAL_CONTENT:
+        return kwargs
+    # Never cache a partial response, let someone else fill the cache
+    if cache_location := kwargs.get("cache_location"):
+        downloads = _core.context.get()["downloads"]
+        download = downloads.get(str(cache_location))
+        if download and not download.path:
+            download.finish()
+    return _CacheOptions()
+
+
+def _accepts(content_encoding: str) -> bool:
+    request = _core.request.get()
+    if not request:
+        return False
+    qvalues: dict[str, float] = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = item.split(";")
+        qvalue = 1.
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.
+        qvalues[coding.strip().lower()] = qvalue
+    default = qvalues.get("*", 0.)
+    return all(
+        qvalues.get(coding, default) > 0
+        for item in content_encoding.split(",")
+        if (coding := item.strip().lower()) != "identity"
+    )
+
+
+async def _attempt(
+    url: str,
+    kwargs: Mapping[str, Any],
+) -> _Opened:
+    ctx = _core.context.get()
+    client = ctx["httpx_client"]
+    async with contextlib.AsyncExitStack() as stack:
+        response = await stack.enter_async_context(
+            client.stream("GET", url, **kwargs),
+        )
+        return _Opened(response, stack.pop_all())
+    return _core.unreachable()
+
+
+async def _cancel(tasks: Collection[asyncio.Task[Any]]) -> None:
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    with anyio.CancelScope(shield=True):
+        await asyncio.wait(tasks)
+
+
+def _chunks(
+    response: httpx.Response,
+    response_headers: httpx.Headers,
+    mirrors: Iterator[str],
+    headers: Mapping[str, str] | None,
+    kwargs: _CacheOptions,
+) -> AsyncGenerator[bytes]:
+    if "Content-Encoding" in response_headers:
+        return response.aiter_raw()
+    if kwargs.get("sha256"):
+        # Only resume when the spliced content can be verified
+        return _resumable(response, mirrors, headers)
+    return response.aiter_bytes()
+
+
+def _download(cache_location: StrPath) -> _core.Download:
+    downloads = _core.context.get()["downloads"]
+    key = str(cache_location)
+    if download := downloads.get(key):
+        return download
+    downloads[key] = download = _core.Download(pathlib.Path(cache_location))
+    return download
+
+
+async def _fetch_piece(
+    url: str,
+    headers: Mapping[str, str] | None,
+    pieces: _Pieces,
+    piece: int,
+    f: FileIO,
+) -> bool:
+    ctx = _core.context.get()
+    client = ctx["httpx_client"]
+    loop = asyncio.get_running_loop()
+    start, end = pieces.span(piece)
+    async with client.stream(
+        "GET",
+        url,
+        headers={
+            **(headers or {}),
+            "Accept-Encoding": "identity",
+            "Range": f"bytes={start}-{end - 1}",
+        },
+    ) as response:
+        if not _starts_at(response, start):
+            return False
+        await loop.run_in_executor(None, f.seek, start)
+        async for chunk in response.aiter_raw():
+            start += await loop.run_in_executor(
+                None,
+                f.write,
+                chunk[:end - start],
+            )
+            pieces.advance(piece, start)
+            if start >= end:
+                break
+    return True
+
+
+async def _fetch_pieces(
+    url: str,
+    headers: Mapping[str, str] | None,
+    pieces: _Pieces,
+) -> None:
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(None, pieces.path.open, "r+b", 0)
+    try:
+        while (piece := pieces.take()) is not None:
+            try:
+                if not await _fetch_piece(url, headers, pieces, piece, f):
+                    return
+            except httpx.HTTPError:
+                return
+            finally:
+                start, end = pieces.span(piece)
+                if start < end:
+                    pieces.put_back(piece)
+    finally:
+        await loop.run_in_executor(None, f.close)
+
+
+async def _from_blob(
+    media_type: str | None,
+    kwargs: _CacheOptions,
+) -> FileResponse | None:
+    cache_location = kwargs.get("cache_location")
+    sha256 = kwargs.get("sha256")
+    if not (cache_location and sha256):
+        return None
+    loop = asyncio.get_running_loop()
+    size = await loop.run_in_executor(
+        None,
+        _link_blob,
+        sha256,
+        pathlib.Path(cache_location),
+    )
+    if size is None:
+        return None
+    ctx = _core.context.get()
+    ctx["index"].touch(str(cache_location), size)
+    ctx["metrics"].cache_result("fill", size)
+    return FileResponse(cache_location, media_type=media_type)
+
+
 def _get_stack(request: fastapi.Request) -> contextlib.AsyncExitStack:
     stack: contextlib.AsyncExitStack
     match request.scope:
@@ -271,8 +743,294 @@ def _get_stack(request: fastapi.Request) -> contextlib.AsyncExitStack:
             return _core.unreachable()
 
 
-async def _stream(
+def _link_blob(sha256: bytes, cache_location: pathlib.Path) -> int | None:
+    blob = _core.blob_path(sha256)
+    try:
+        size = blob.stat().st_size
+        cache_location.parent.mkdir(parents=True, exist_ok=True)
+        cache_location.hardlink_to(blob)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        _logger.debug("Failed to link %s to %s: %r", cache_location, blob, e)
+        return None
+    return size
+
+
+async def _multipart_byteranges(
+    download: _core.Download,
+    ranges: Iterable[tuple[int, int]],
+    boundary: str,
+    header: Callable[[int, int], bytes],
+) -> AsyncIterator[bytes]:
+    for start, end in ranges:
+        yield header(start, end)
+        async for chunk in download.aiter_bytes(start, end):
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--".encode("latin-1")
+
+
+async def _not_found(urls: str | frozenset[str]) -> bool:
+    http_cache = _core.context.get()["http_cache"]
+    return await http_cache.not_found(_not_found_key(urls))
+
+
+def _not_found_key(urls: str | frozenset[str]) -> str:
+    return urls if isinstance(urls, str) else "\n".join(sorted(urls))
+
+
+async def _open(
+    stack: contextlib.AsyncExitStack,
+    mirrors: Iterator[str],
+    **kwargs: object,
+) -> httpx.Response | None:
+    ctx = _core.context.get()
+    s = ctx["statistics"]
+    attempts: set[asyncio.Task[_Opened]] = set()
+    pending = attempts.copy()
+    delay = None
+    try:
+        while True:
+            if not pending:
+                if not (url := next(mirrors, None)):
+                    return None
+                pending.add(asyncio.create_task(_attempt(url, kwargs)))
+                attempts |= pending
+                delay = s.hedge_delay(url)
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            delay = None
+            for task in done:
+                try:
+                    response, opened = task.result()
+                except httpx.HTTPError:
+                    continue
+                attempts.remove(task)
+                await stack.enter_async_context(opened)
+                return response
+            if not done and (url := next(mirrors, None)):
+                # The mirror is slower than usual, race the next one
+                _logger.info("Hedging request: %s", url)
+                s.hedge()
+                pending.add(asyncio.create_task(_attempt(url, kwargs)))
+                attempts |= pending
+    finally:
+        await _cancel(attempts)
+        for task in attempts:
+            if not task.cancelled() and not task.exception():
+                _, opened = task.result()
+                await opened.aclose()
+
+
+@contextlib.contextmanager
+def _preallocated(
+    download: _core.Download,
+    sha256: bytes,
+) -> Generator[pathlib.Path]:
+    cache_location = download.cache_location
+    dir_ = cache_location.parent
+    dir_.mkdir(parents=True, exist_ok=True)
+    with (
+        pooch.utils.temporary_file(dir_) as tmp,  # pyright: ignore[reportUnknownMemberType]
+        contextlib.ExitStack() as stack,
+    ):
+        path = pathlib.Path(tmp)
+        with path.open("wb") as f:
+            f.truncate(download.size)
+        try:
+            yield path
+        finally:
+            if download.written == download.size:
+                with path.open("rb") as f:
+                    digest = hashlib.file_digest(f, "sha256").digest()
+                if digest == sha256:
+                    stack.callback(download.succeed)
+                    stack.callback(_store_blob, sha256, cache_location)
+                    stack.callback(shutil.move, tmp, cache_location)
+
+
+async def _remember_not_found(
+    urls: str | frozenset[str],
+    misses: int,
+) -> None:
+    # Only when every mirror agrees, one of them may just lag behind
+    ctx = _core.context.get()
+    ttl = ctx["config"].upstream.not_found_ttl
+    if ttl and misses >= (1 if isinstance(urls, str) else len(urls)):
+        await ctx["http_cache"].remember_not_found(_not_found_key(urls), ttl)
+
+
+async def _resumable(
     response: httpx.Response,
+    mirrors: Iterator[str],
+    headers: Mapping[str, str] | None,
+) -> AsyncGenerator[bytes]:
+    offset = 0
+    async with contextlib.AsyncExitStack() as stack:
+        # ruff: disable[yield-in-context-manager-in-async-generator]
+        while True:
+            try:
+                async for chunk in response.aiter_bytes():
+                    offset += len(chunk)
+                    yield chunk
+            except httpx.TransportError:
+                # Decoded offsets do not map back to encoded ranges
+                if "Content-Encoding" in response.headers or not (
+                    resumed := await _resume(stack, mirrors, headers, offset)
+                ):
+                    raise
+                response = resumed
+            else:
+                return
+        # ruff: enable[yield-in-context-manager-in-async-generator]
+
+
+async def _resume(
+    stack: contextlib.AsyncExitStack,
+    mirrors: Iterator[str],
+    headers: Mapping[str, str] | None,
+    offset: int,
+) -> httpx.Response | None:
+    ctx = _core.context.get()
+    client = ctx["httpx_client"]
+    for url in mirrors:
+        try:
+            response = await stack.enter_async_context(
+                client.stream(
+                    "GET",
+                    url,
+                    headers={
+                        **(headers or {}),
+                        "Accept-Encoding": "identity",
+                        "Range": f"bytes={offset}-",
+                    },
+                ),
+            )
+        except httpx.HTTPError:
+            continue
+        if _starts_at(response, offset):
+            _logger.info("Resuming from byte %d: %s", offset, url)
+            return response
+        _core.schedule_exit(stack)
+    return None
+
+
+async def _segmented(
+    stack: contextlib.AsyncExitStack,
+    urls: Iterable[str],
+    headers: Mapping[str, str] | None,
+    media_type: str | None,
+    kwargs: _CacheOptions,
+) -> fastapi.Response | None:
+    ctx = _core.context.get()
+    threshold = ctx["config"].upstream.segment_threshold
+    cache_location = kwargs.get("cache_location")
+    sha256 = kwargs.get("sha256")
+    size = kwargs.get("size")
+    if (
+        isinstance(urls, str)
+        or not (cache_location and sha256 and size and threshold)
+        or size < threshold
+        or (headers and "Range" in headers)
+    ):
+        return None
+    # Tripped or backup mirrors would just sit on a piece
+    key = _core.context.get()["statistics"].key
+    urls = [
+        url for url in load_balance(urls, size)
+        if not any(key(url, size)[:2])
+    ]
+    if len(urls) < 2:  # ruff: ignore[magic-value-comparison]
+        return None
+    download = _download(cache_location)
+    download.size = size
+    new_stack = contextlib.AsyncExitStack()
+    content = _segments(urls, headers, download, sha256, new_stack)
+    try:
+        if await anext(content):
+            _core.unreachable()
+    except _SegmentedError:
+        return None
+    await new_stack.enter_async_context(stack.pop_all())
+    return StreamingResponse(
+        content,
+        headers={"Content-Length": str(size)},
+        media_type=media_type,
+    )
+
+
+async def _segments(
+    urls: list[str],
+    headers: Mapping[str, str] | None,
+    download: _core.Download,
+    sha256: bytes,
+    wrapped: contextlib.AsyncExitStack,
+) -> AsyncIterator[bytes]:
+    scope = anyio.CancelScope(shield=True)
+    async with contextlib.AsyncExitStack() as stack:
+        # ruff: disable[yield-in-context-manager-in-async-generator]
+        outer = await stack.enter_async_context(contextlib.AsyncExitStack())
+        await stack.enter_async_context(wrapped)
+        inner = contextlib.ExitStack()
+        loop = asyncio.get_running_loop()
+
+        @stack.callback
+        def _() -> None:
+            try:
+                outer.enter_context(scope)
+            finally:
+                fut = loop.run_in_executor(None, inner.close)
+                if download.path:
+                    outer.callback(download.finish)
+                outer.push_async_callback(lambda: fut)
+        path = await loop.run_in_executor(
+            None,
+            inner.enter_context,
+            _preallocated(download, sha256),
+        )
+        size = cast("int", download.size)
+        pieces = _Pieces(
+            download,
+            path,
+            max(size // (len(urls) * 4), 1 << 20),
+        )
+        tasks = [
+            asyncio.create_task(_fetch_pieces(url, headers, pieces))
+            for url in urls
+        ]
+        workers = asyncio.gather(*tasks, return_exceptions=True)
+
+        @workers.add_done_callback
+        def _(fut: asyncio.Future[list[object]]) -> None:
+            # Every mirror gave up, let the followers know
+            if download.path and download.written < size:
+                download.finish()
+            if not fut.cancelled():
+                for result in fut.result():
+                    if isinstance(result, Exception):
+                        _logger.error("Segment failed", exc_info=result)
+
+        stack.push_async_callback(_cancel, tasks)
+        started = asyncio.ensure_future(download.started())
+        await asyncio.wait(
+            [started, workers],
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        started.cancel()
+        if not download.path:
+            raise _SegmentedError
+        yield b""
+        async for chunk in download.aiter_bytes(0, size):
+            yield chunk
+        # ruff: enable[yield-in-context-manager-in-async-generator]
+
+
+async def _stream(
+    chunks: AsyncGenerator[bytes],
     wrapped: contextlib.AsyncExitStack,
     *,
     cache_location: StrPath | None = None,
@@ -285,10 +1043,13 @@ async def _stream(
         # ruff: disable[yield-in-context-manager-in-async-generator]
         outer = await stack.enter_async_context(contextlib.AsyncExitStack())
         await stack.enter_async_context(wrapped)
+        stack.push_async_callback(chunks.aclose)
         if cache_location and sha256:
             h = hashlib.sha256()
             inner = contextlib.ExitStack()
             loop = asyncio.get_running_loop()
+            download = _download(cache_location)
+            download.size = size
 
             @stack.callback
             def _() -> None:
@@ -296,56 +1057,88 @@ async def _stream(
                     outer.enter_context(scope)
                 finally:
                     fut = loop.run_in_executor(None, inner.close)
+                    outer.callback(download.finish)
                     outer.push_async_callback(lambda: fut)
-            fwrite = await loop.run_in_executor(
+            f = await loop.run_in_executor(
                 None,
                 inner.enter_context,
-                _tempfile(response, cache_location, sha256, size, h),
+                _tempfile(download, sha256, h),
             )
-            async for current in response.aiter_bytes():
-                fut = loop.run_in_executor(None, fwrite, current)
+            writer = _Writer(f, download, h)
+            inner.callback(writer.close)
+            download.start(pathlib.Path(f.name))
+            async for current in chunks:
+                await writer.write(current)
                 yield last
                 last = current
-                await fut
-                h.update(current)
+            await writer.flush()
         else:
             stack.callback(outer.enter_context, scope)
             if cache_location or sha256:
                 _core.unreachable()
-            async for current in response.aiter_bytes():
+            async for current in chunks:
                 yield last
                 last = current
         yield last
         # ruff: enable[yield-in-context-manager-in-async-generator]
 
 
+def _skipped(urls: str | frozenset[str]) -> int:
+    # Mirrors left out by `load_balance` count as agreeing on a 404
+    if isinstance(urls, str):
+        return 0
+    return len(urls) - len(_core.context.get()["statistics"].healthy(urls))
+
+
+def _starts_at(response: httpx.Response, offset: int) -> bool:
+    return (
+        response.status_code == http.HTTPStatus.PARTIAL_CONTENT
+        and "Content-Encoding" not in response.headers
+        and response.headers.get("Content-Range", "").startswith(
+            f"bytes {offset}-",
+        )
+    )
+
+
+def _store_blob(sha256: bytes, cache_location: pathlib.Path) -> None:
+    blob = _core.blob_path(sha256)
+    try:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        blob.hardlink_to(cache_location)
+    except FileExistsError:
+        # Same bytes under another path, share them instead of a copy
+        tmp = cache_location.with_name(f".{secrets.token_hex(8)}.tmp")
+        try:
+            tmp.hardlink_to(blob)
+            tmp.replace(cache_location)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    except OSError as e:
+        _logger.debug("Failed to link %s to %s: %r", blob, cache_location, e)
+
+
 @contextlib.contextmanager
 def _tempfile(
-    response: httpx.Response,
-    cache_location: StrPath,
+    download: _core.Download,
     sha256: bytes,
-    size: int | None,
     hash_: HASH,
-) -> Generator[Callable[[ReadableBuffer], int]]:
-    dir_ = pathlib.Path(cache_location).parent
+) -> Generator[FileIO]:
+    cache_location = download.cache_location
+    size = download.size
+    dir_ = cache_location.parent
     dir_.mkdir(parents=True, exist_ok=True)
     with (
         pooch.utils.temporary_file(dir_) as tmp,  # pyright: ignore[reportUnknownMemberType]
         contextlib.ExitStack() as stack,
-        pathlib.Path(tmp).open("wb") as f,
+        pathlib.Path(tmp).open("wb", buffering=0) as f,
     ):
         f.truncate(size)
         try:
-            yield f.write
+            yield f
         finally:
-            if hash_.digest() == sha256 and (
-                size is None
-                or size == (
-                    f.tell()
-                    if "Content-Encoding" in response.headers
-                    else response.num_bytes_downloaded
-                )
-            ):
+            if hash_.digest() == sha256 and size in {None, f.tell()}:
+                stack.callback(download.succeed)
+                stack.callback(_store_blob, sha256, cache_location)
                 stack.callback(shutil.move, tmp, cache_location)
 
 
@@ -353,7 +1146,10 @@ def _unify_content_length(
     headers: httpx.Headers,
     kwargs: _CacheOptions,
 ) -> httpx.Headers:
-    if "Content-Encoding" in headers:
+    if content_encoding := headers.get("Content-Encoding"):
+        if not kwargs.get("sha256") and _accepts(content_encoding):
+            # Forwarded as is, with the encoded Content-Length
+            return headers
         # Content-Length refer to the encoded data, see
         # https://developer.mozilla.org/en-US/docs/Web/HTTP/Reference/Headers/Content-Encoding
         headers = headers.copy()
@@ -361,7 +1157,7 @@ def _unify_content_length(
             headers["Content-Length"] = str(size)
         else:
             headers.pop("Content-Length", None)
-        # Content-Encoding will be removed in Response.init_headers
+        del headers["Content-Encoding"]
         return headers
     if content_length := headers.get("Content-Length"):
         actual = int(content_length)
@@ -378,6 +1174,38 @@ def _unify_content_length(
     return headers
 
 
+def _with_range(
+    headers: Mapping[str, str] | None,
+) -> Mapping[str, str] | None:
+    request = _core.request.get()
+    if (
+        not request
+        or "Range" not in request.headers
+        or _core.cache_action.get() != "no-cache"
+    ):
+        return headers
+    return {
+        **(headers or {}),
+        **{
+            key: value
+            for key in ("Range", "If-Range")
+            if (value := request.headers.get(key))
+        },
+    }
+
+
+def _x_accel_redirect(path: StrPath) -> str | None:
+    path = pathlib.Path(path)
+    if path.is_absolute():
+        try:
+            path = path.relative_to(pathlib.Path.cwd())
+        except ValueError:
+            return None
+    uri = f"/_mahoraga/{path.as_posix()}"
+    # Avoid relying on how the front server unquotes the header
+    return uri if _pchar.fullmatch(uri) else None
+
+
 def _wrap_file_not_found_error(
     _exc_type: type[BaseException] | None,
     exc_value: BaseException | None,
@@ -390,4 +1218,8 @@ def _wrap_file_not_found_error(
             pass
 
 
+_BATCH_DELAY = 0.1
+_BATCH_SIZE = 1 << 20
+_MAX_PENDING = 4
 _logger = logging.getLogger("mahoraga")
+_pchar = re.compile(r"[\w!$&'()*+,.:;=@/~-]+", re.ASCII)
@@ -19,7 +19,7 @@ import logging
 import pathlib
 from typing import Annotated, TypedDict
 
-import fastapi.responses
+import fastapi
 import pooch  # pyright: ignore[reportMissingTypeStubs]
 
 from mahoraga import _core
@@ -49,8 +49,8 @@ async def get_npm_file(
 ) -> fastapi.Response:
     cache_location = pathlib.Path(request.url.path.lstrip("/"))
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(cache_location)
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(cache_location)
         prefix = request.url.path.removeprefix("/npm")
         if prefix.startswith("/@"):
             scope, _ = prefix[2:].split("/", 1)
@@ -69,8 +69,12 @@ async def get_npm_file(
         package = f"{package}@{resolved.version}"
         if resolved.version != version:
             cache_location = pathlib.Path("npm", package, path)
-            if await _core.cached_or_locked(cache_location, stack):
-                return fastapi.responses.FileResponse(cache_location)
+            if await _core.cached_or_locked(
+                cache_location,
+                stack,
+                follow=True,
+            ):
+                return _core.FileResponse(cache_location)
         return await _utils.get_npm_file(
             resolved.links["self"],
             package,
@@ -53,8 +53,8 @@ async def get_pyodide_package(
     cache_location = pathlib.Path("pyodide", name)
     media_type, _ = mimetypes.guess_type(name)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(
                 cache_location,
                 media_type=media_type,
             )
@@ -122,8 +122,8 @@ async def get_pyodide_core_file(
     name = posixpath.basename(request.url.path)
     cache_location = pathlib.Path("npm", package, name)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(cache_location)
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(cache_location)
         return await _utils.get_npm_file(
             f"https://data.jsdelivr.com/v1/packages/npm/{package}",
             package,
@@ -175,8 +175,8 @@ async def get_pyodide_file(
         return await _core.stream(urls, media_type=media_type)
     cache_location = pathlib.Path("pyodide", version, "full", path)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(cache_location)
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(cache_location)
         version = version.lstrip("v")
         tarball = pathlib.Path("pyodide", f"pyodide-{version}.tar.bz2")
         if response := await _utils.extract_from_tarball(
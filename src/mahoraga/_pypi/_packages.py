@@ -23,7 +23,7 @@ import pathlib
 import posixpath
 from typing import TYPE_CHECKING, Annotated
 
-import fastapi.responses
+import fastapi
 import httpx
 import packaging.utils
 
@@ -83,8 +83,8 @@ async def get_pypi_package(
         media_type, _ = mimetypes.guess_type(filename)
     cache_location = pathlib.Path("packages", tag, prefix, project, filename)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(
                 cache_location,
                 media_type=media_type,
             )
@@ -18,8 +18,11 @@ import asyncio
 import collections
 import contextlib
 import contextvars
+import email.utils
 import http
+import logging
 import posixpath
+import time
 from typing import Annotated, Literal
 
 import fastapi
@@ -29,6 +32,8 @@ from mahoraga import _core
 
 from . import _models  # ruff: ignore[typing-only-first-party-import]
 
+_REFRESH = 600.
+
 router: fastapi.APIRouter = fastapi.APIRouter(route_class=_core.APIRoute)
 
 
@@ -64,10 +69,19 @@ async def get_pypi_project(
             posixpath.join(str(url), "simple", project) + "/"
             for url in config.upstream.pypi.all()
         ]
+    # The same key the HTTP cache files the index under, HTML included
+    key = _core.simple_cache_key(urls[0], media_type) or _core.unreachable()
+    age = await _age(key)
+    pypi = config.upstream.pypi
+    if age is not None and age <= pypi.stale_while_revalidate:
+        if age >= _REFRESH and not (lock := locks[key]).locked():
+            _revalidate(ctx.copy(), urls, lock, media_type)
+        with contextlib.suppress(NotImplementedError):
+            return await _stale(ctx.copy(), urls, media_type)
     ctx.run(_core.cache_action.set, "cache-or-fetch")
     async with contextlib.AsyncExitStack() as stack:
-        await stack.enter_async_context(locks[f"{project}|{media_type}"])
-        return await asyncio.create_task(
+        await stack.enter_async_context(locks[key])
+        response = await asyncio.create_task(
             _core.stream(
                 urls,
                 headers={"Accept": media_type},
@@ -76,6 +90,26 @@ async def get_pypi_project(
             ),
             context=ctx,
         )
+    if (
+        response.status_code >= http.HTTPStatus.INTERNAL_SERVER_ERROR
+        and age is not None
+        and age <= pypi.stale_if_error
+    ):
+        with contextlib.suppress(NotImplementedError):
+            return await _stale(ctx.copy(), urls, media_type)
+    return response
+
+
+async def _age(key: str) -> float | None:
+    # Measured from the Date header, like hishel does
+    storage = _core.context.get()["http_cache"]
+    dates = [
+        email.utils.mktime_tz(parsed)
+        for entry in await storage.get_entries(key)
+        if (date := entry.response.headers.get("Date"))
+        and (parsed := email.utils.parsedate_tz(date))
+    ]
+    return time.time() - max(dates) if dates else None
 
 
 def _decide_content_type(accept: str | None) -> Literal[
@@ -114,3 +148,47 @@ def _decide_content_type(accept: str | None) -> Literal[
         if "text/html" in v or "text/*" in v:
             return "text/html"
     raise fastapi.HTTPException(http.HTTPStatus.NOT_ACCEPTABLE)
+
+
+async def _refresh(
+    urls: list[str],
+    lock: asyncio.Lock,
+    media_type: str,
+) -> None:
+    async with lock:
+        try:
+            await _core.get(urls, headers={"Accept": media_type})
+        except fastapi.HTTPException as e:
+            _logger.info("Failed to refresh %s: %r", urls[0], e)
+
+
+def _revalidate(
+    ctx: contextvars.Context,
+    urls: list[str],
+    lock: asyncio.Lock,
+    media_type: str,
+) -> None:
+    futures = ctx[_core.context]["futures"]
+    ctx.run(_core.cache_action.set, "cache-or-fetch")
+    task = asyncio.create_task(_refresh(urls, lock, media_type), context=ctx)
+    futures.add(task)
+    task.add_done_callback(futures.discard)
+
+
+async def _stale(
+    ctx: contextvars.Context,
+    urls: list[str],
+    media_type: str,
+) -> fastapi.Response:
+    ctx.run(_core.cache_action.set, "force-cache-only")
+    return await asyncio.create_task(
+        _core.stream(
+            urls,
+            headers={"Accept": media_type},
+            media_type=media_type,
+        ),
+        context=ctx,
+    )
+
+
+_logger = logging.getLogger("mahoraga")
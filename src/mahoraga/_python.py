@@ -27,7 +27,7 @@ import re
 import urllib.parse
 from typing import Annotated
 
-import fastapi.responses
+import fastapi
 import packaging.version
 import pydantic
 import pydantic_extra_types.semantic_version  # ruff: ignore[typing-only-third-party-import]
@@ -98,8 +98,8 @@ async def get_standalone_python(
     media_type, _ = mimetypes.guess_type(name)
     cache_location = pathlib.Path("python-build-standalone", tag, name)
     async with contextlib.AsyncExitStack() as stack:
-        if await _core.cached_or_locked(cache_location, stack):
-            return fastapi.responses.FileResponse(
+        if await _core.cached_or_locked(cache_location, stack, follow=True):
+            return _core.FileResponse(
                 cache_location,
                 media_type=media_type,
             )
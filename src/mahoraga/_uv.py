@@ -40,8 +40,12 @@ async def get_uv_github_release(name: str) -> fastapi.Response:
         cache_location = pathlib.Path("uv", tag, name)
         headers = {"Cache-Control": "public, max-age=31536000, immutable"}
         async with contextlib.AsyncExitStack() as stack:
-            if await _core.cached_or_locked(cache_location, stack):
-                return fastapi.responses.FileResponse(
+            if await _core.cached_or_locked(
+                cache_location,
+                stack,
+                follow=True,
+            ):
+                return _core.FileResponse(
                     cache_location,
                     headers=headers,
                     media_type=media_type,